@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from src.game.bresenham import define_line
+from src.game.car import Car
+from src.game.game import load_from_file, EVOLVE_MODE
+from src.game.nn import NN, PopulationNN, to_genomes, mate, mate_genomes, INPUT_SIZE
+from src.game.selection import select_pairs, SELECTIONS
+from src.game.sensing import DISTANCE_ANGLES
+
+# Times the hot paths of training on the bundled tracks, with fixed
+# seeds so that every run does exactly the same work, and prints the
+# results as JSON. Save a run's output and pass it to --compare later
+# to flag anything that has slowed down.
+#
+#   python benchmark.py --output baseline.json
+#   python benchmark.py --compare baseline.json
+
+TRACKS = ["tracks/track1.json", "tracks/track2.json", "tracks/track3.json"]
+POPULATION_SIZES = [25, 100, 1000, 10000]
+SEED = 1
+
+def seed(value : int = SEED):
+    random.seed(value)
+    np.random.seed(value)
+
+# Time function over number calls, repeat times, returning the median
+# (and best) seconds per call. setup, if given, is called before each
+# repeat and not timed.
+def measure(function, number : int = 1, repeat : int = 5, setup = None) -> dict:
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+    return {"seconds": statistics.median(times), "best": min(times), "number": number, "repeat": repeat}
+
+def load_game(trackfile : str):
+    game = load_from_file(trackfile, headless=True, seed=SEED)
+    game.init()
+    game._mode = EVOLVE_MODE
+    return game
+
+def bench_distance_to_wall(game) -> dict:
+    car = Car(game._car_spawn_position, game._car_spawn_rotation)
+    def run():
+        for angle in DISTANCE_ANGLES:
+            game._track.distance_to_wall(car, angle)
+    return measure(run, number=20)
+
+def bench_sense(game, size : int) -> dict:
+    seed()
+    positions = np.array([game._car_spawn_position] * size, dtype=np.float64)
+    rotations = np.random.uniform(0, 360, size)
+    return measure(lambda: game._sensor.sense(positions, rotations), number=20)
+
+def bench_define_line() -> dict:
+    seed()
+    lines = np.random.randint(0, 1000, size=(100, 4)).tolist()
+    def run():
+        for line in lines:
+            define_line(*line)
+    return measure(run, number=5)
+
+def bench_nn_infer() -> dict:
+    seed()
+    nn = NN()
+    distances = {angle: value for angle, value in zip(DISTANCE_ANGLES, np.random.uniform(0, 500, len(DISTANCE_ANGLES)))}
+    return measure(lambda: nn.infer(5.0, 90.0, distances), number=1000)
+
+def bench_population_infer(size : int) -> dict:
+    seed()
+    nn = PopulationNN(to_genomes([NN() for _ in range(size)]))
+    inputs = np.random.uniform(0, 500, size=(size, INPUT_SIZE))
+    indexes = np.arange(size)
+    return measure(lambda: nn.infer(inputs, indexes), number=100)
+
+def bench_mate() -> dict:
+    seed()
+    a, b = NN(), NN()
+    return measure(lambda: mate(a, b, mutation=0.005), number=100)
+
+def bench_mate_genomes(size : int) -> dict:
+    seed()
+    parents = to_genomes([NN() for _ in range(10)])
+    rng = np.random.default_rng(SEED)
+    a = rng.integers(0, 10, size)
+    b = rng.integers(0, 10, size)
+    return measure(lambda: mate_genomes(parents, a, b, mutation=0.005, rng=rng), number=10)
+
+def bench_select_pairs(size : int, method : str) -> dict:
+    scores = np.random.default_rng(SEED).integers(-100, 3000, 10)
+    rng = np.random.default_rng(SEED)
+    return measure(lambda: select_pairs(scores, size, rng, method=method), number=10)
+
+def bench_car_move(game) -> dict:
+    car = Car(game._car_spawn_position, game._car_spawn_rotation)
+    def setup():
+        car.reset()
+    return measure(lambda: car.move(0.5, 1), number=1000, setup=setup)
+
+# A single Game.on_loop step, averaged over the first steps of a
+# fresh generation
+def bench_on_loop(game, size : int, steps : int = 100) -> dict:
+    seed()
+    genomes = to_genomes([NN() for _ in range(size)])
+    simulation = game.create_simulation()
+    def setup():
+        simulation.start(genomes)
+        game._simulation = simulation
+        game._population = simulation.population
+        game._tick = 0
+    return measure(game.on_loop, number=steps, setup=setup)
+
+# A complete headless generation, from spawn until every car has
+# crashed or time runs out, with each step covering timestep ticks
+def bench_generation(game, size : int, timestep : int = 1) -> dict:
+    seed()
+    genomes = to_genomes([NN() for _ in range(size)])
+    game._timestep = timestep
+    simulation = game.create_simulation()
+    game._timestep = 1
+    result = measure(lambda: simulation.run(genomes), repeat=1 if size >= 1000 else 3)
+    result["ticks"] = simulation.tick
+    result["car_ticks_per_second"] = size * simulation.tick / result["seconds"]
+    return result
+
+def run_benchmarks(tracks : [str], sizes : [int], only : str = None) -> dict:
+    results = {}
+    def record(name, bench, *args):
+        if only is not None and only not in name:
+            return
+        print(f"{name}...", file=sys.stderr, flush=True)
+        results[name] = bench(*args)
+
+    record("bresenham.define_line", bench_define_line)
+    record("NN.infer", bench_nn_infer)
+    record("nn.mate", bench_mate)
+    for size in sizes:
+        record(f"PopulationNN.infer/{size}", bench_population_infer, size)
+        record(f"nn.mate_genomes/{size}", bench_mate_genomes, size)
+        for method in SELECTIONS:
+            record(f"select_pairs.{method}/{size}", bench_select_pairs, size, method)
+
+    for trackfile in tracks:
+        track = os.path.splitext(os.path.basename(trackfile))[0]
+        game = load_game(trackfile)
+        record(f"{track}/Track.distance_to_wall", bench_distance_to_wall, game)
+        record(f"{track}/Car.move", bench_car_move, game)
+        for size in sizes:
+            record(f"{track}/sensor.sense/{size}", bench_sense, game, size)
+            record(f"{track}/Game.on_loop/{size}", bench_on_loop, game, size)
+            record(f"{track}/generation/{size}", bench_generation, game, size)
+            record(f"{track}/generation.timestep4/{size}", bench_generation, game, size, 4)
+
+    return results
+
+# Compare results to a baseline, returning the names of everything
+# that is slower by more than threshold (ie 0.1 for 10%)
+def compare(results : dict, baseline : dict, threshold : float) -> [str]:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["seconds"] / baseline[name]["seconds"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = "faster"
+        print(f"{name:45} {baseline[name]['seconds']:12.6f}s -> {result['seconds']:12.6f}s {ratio:6.2f}x {flag}", file=sys.stderr)
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark sensing, inference, breeding and whole generations")
+    parser.add_argument("--tracks", nargs="+", default=TRACKS, help="the track files to benchmark on")
+    parser.add_argument("--sizes", nargs="+", type=int, default=POPULATION_SIZES, help="the population sizes to benchmark")
+    parser.add_argument("--only", default=None, help="only run benchmarks with this in their name")
+    parser.add_argument("--output", default=None, metavar="FILE", help="write the results here instead of to stdout")
+    parser.add_argument("--compare", default=None, metavar="FILE", help="flag regressions against the results saved in this file")
+    parser.add_argument("--threshold", type=float, default=0.1, help="how much slower (0.1 is 10%%) counts as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.tracks, args.sizes, args.only)
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "seed": SEED,
+        "results": results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output is not None:
+        with open(args.output, "w") as writefile:
+            writefile.write(output)
+    else:
+        print(output)
+
+    if args.compare is not None:
+        with open(args.compare) as readfile:
+            baseline = json.load(readfile)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,15 @@
+import sys
+from src.game.game import load_from_file
+from src.game.bundle import compile_bundle, BUNDLE_EXTENSION
+
+if len(sys.argv) not in (2, 3):
+    print("Pass in a track.json file to compile, and optionally where to save the bundle to")
+    sys.exit()
+
+trackpath = sys.argv[1]
+bundlepath = sys.argv[2] if len(sys.argv) == 3 else trackpath.rsplit(".", 1)[0] + BUNDLE_EXTENSION
+
+game = load_from_file(trackpath, headless=True)
+game.init()
+compile_bundle(game, bundlepath)
+print(f"Compiled {trackpath} to {bundlepath}")
@@ -1,5 +1,6 @@
 import sys
 from src.game.game import Game, EVOLVE_MODE
+from src.game.bundle import compile_bundle, BUNDLE_EXTENSION
 
 if len(sys.argv) != 3:
     print("Two command line arguments required - the image asset, and where to save your track file to")
@@ -12,4 +13,7 @@ game = Game(imagepath, mode=EVOLVE_MODE, cars_per_generation=50)
 game.init()
 game.setup()
 
-game.save(trackpath)
\ No newline at end of file
+game.save(trackpath)
+
+# Also compile the track for fast loading in worker processes
+compile_bundle(game, trackpath.rsplit(".", 1)[0] + BUNDLE_EXTENSION)
@@ -1,17 +1,110 @@
-import sys
-from src.game.game import Game, load_from_file
+import argparse
+from src.game.game import Game, load_from_file, WATCH_PACING, TURBO_PACING
 
-if len(sys.argv) < 2 or len(sys.argv) > 3:
-    print("A command line argumnet is required - a specified track.json file")
-    sys.exit()
+# Everything runs from main, so that worker and island processes
+# started with spawn or forkserver can import this file safely
+def main():
+    parser = argparse.ArgumentParser(description="Evolve a population of cars on a track")
+    parser.add_argument("track", help="a track.json file created by create_track.py")
+    parser.add_argument("population_size", nargs="?", type=int, default=50, help="how many cars are in each generation")
+    parser.add_argument("--headless", action="store_true", help="run without a window or frame rate cap")
+    parser.add_argument("--render-thread", action="store_true", help="simulate on a separate thread from drawing, so drawing can skip frames rather than hold the simulation back")
+    parser.add_argument("--turbo", action="store_true", help="with --render-thread, start out simulating as fast as possible rather than in real time (T switches)")
+    parser.add_argument("--draw-top", type=int, default=None, metavar="K", help="only draw the K best scoring cars")
+    parser.add_argument("--draw-alive", action="store_true", help="don't draw cars once they have crashed")
+    parser.add_argument("--seed", type=int, default=None, help="seed every random choice so runs can be reproduced")
+    parser.add_argument("--sensor-range", type=float, default=None, help="the furthest, in pixels, a car can see a wall")
+    parser.add_argument("--sensor-table", type=float, default=None, metavar="DEGREES", help="precompute wall distances at this angular resolution instead of casting rays")
+    parser.add_argument("--sensor-dtype", choices=["uint16", "float16"], default="uint16", help="how precisely the sensor table stores distances")
+    parser.add_argument("--timestep", type=int, default=1, metavar="TICKS", help="how many ticks (1/60s) each simulation step covers - cars sense and decide once per step")
+    parser.add_argument("--substeps", type=int, default=1, help="split the movement of each step into this many parts (--substeps equal to --timestep moves cars exactly as one tick steps would)")
+    parser.add_argument("--stall-ticks", type=int, default=None, help="retire cars that go this many ticks without reaching a new checkpoint")
+    parser.add_argument("--stall-window", type=int, default=None, help="every this many ticks, retire cars that moved less than --stall-distance")
+    parser.add_argument("--stall-distance", type=float, default=20, help="how far, in pixels, a car must move each --stall-window")
+    parser.add_argument("--fitness-cache", type=int, default=100000, metavar="SIZE", help="remember the scores of this many genomes so they aren't simulated again, 0 to turn off (headless only)")
+    parser.add_argument("--reevaluate", action="store_true", help="simulate every car each generation, even ones already scored")
+    parser.add_argument("--timings", default=None, metavar="FILE", help="write how long each phase of every generation took to this file")
+    parser.add_argument("--timings-format", choices=["jsonl", "prometheus"], default="jsonl", help="append a JSON line per generation, or keep a Prometheus text file up to date")
+    parser.add_argument("--profile", default=None, metavar="FILE", help="run each generation under cProfile, saving the stats to FILE.<generation>")
+    parser.add_argument("--record", default=None, metavar="FILE", help="record every car's path to this file, to watch again with replay.py (every car is then simulated in this process)")
+    parser.add_argument("--snapshot", default=None, metavar="FILE", help="save every scored generation to this file")
+    parser.add_argument("--resume", default=None, metavar="FILE", help="continue evolving from a snapshot (and keep saving to it, unless --snapshot is given)")
+    parser.add_argument("--selection", choices=["proportional", "tournament", "rank", "sus"], default="proportional", help="how parents are picked to mate")
+    parser.add_argument("--workers", type=int, default=1, help="split each generation across this many processes (headless only)")
+    parser.add_argument("--bundle", default=None, metavar="FILE", help="a track bundle from compile_track.py for workers and islands to load, for faster startup")
+    parser.add_argument("--no-shared-track", action="store_true", help="have each worker and island load its own copy of the track instead of sharing this process' copy")
+    parser.add_argument("--islands", type=int, default=1, help="evolve this many separate populations in parallel, swapping their best cars (headless only)")
+    parser.add_argument("--listen", default=None, metavar="HOST:PORT", help="run a single island, receiving migrants on this address")
+    parser.add_argument("--peer", default=None, metavar="HOST:PORT", help="with --listen, the address of the next island to send migrants to")
+    parser.add_argument("--migrate-every", type=int, default=5, help="how many generations between migrations")
+    parser.add_argument("--migrants", type=int, default=2, help="how many of its best cars an island sends each migration")
+    args = parser.parse_args()
+    if args.workers > 1 and not args.headless:
+        parser.error("--workers requires --headless")
+    if args.timestep < 1 or args.substeps < 1:
+        parser.error("--timestep and --substeps must be at least 1")
+    if args.turbo and not args.render_thread:
+        parser.error("--turbo requires --render-thread")
+    if (args.listen is None) != (args.peer is None):
+        parser.error("--listen and --peer must be used together")
+    if args.islands > 1 and args.listen is not None:
+        parser.error("--islands can't be combined with --listen/--peer")
+    if (args.islands > 1 or args.listen is not None) and (args.snapshot is not None or args.resume is not None or args.record is not None):
+        parser.error("--snapshot, --resume and --record can't be used with islands")
 
-trackpath = sys.argv[1]
+    game = load_from_file(args.track, headless=args.headless, seed=args.seed)
+    game._cars_per_generation = args.population_size
+    game._sensor_range = args.sensor_range
+    game._sensor_resolution = args.sensor_table
+    game._sensor_dtype = args.sensor_dtype
+    game._workers = args.workers
+    game._render_thread = args.render_thread and not args.headless
+    game._pacing = TURBO_PACING if args.turbo else WATCH_PACING
+    game._draw_top = args.draw_top
+    game._draw_alive_only = args.draw_alive
+    game._selection = args.selection
+    game._bundle_file = args.bundle
+    game._share_track = not args.no_shared_track
+    game._fitness_cache_size = args.fitness_cache
+    game._timings_file = args.timings
+    game._timings_format = args.timings_format
+    game._profile_file = args.profile
+    game._recording_file = args.record
+    game._reevaluate = args.reevaluate
+    game._timestep = args.timestep
+    game._substeps = args.substeps
+    game._stall_ticks = args.stall_ticks
+    game._stall_window = args.stall_window
+    game._stall_distance = args.stall_distance
+    game._snapshot_file = args.snapshot if args.snapshot is not None else args.resume
 
-populaton_size = 50
-if len(sys.argv) == 3:
-    population_size = int(sys.argv[2])
+    if args.islands > 1 or args.listen is not None:
+        from src.game.islands import run_island, run_islands, SocketTransport, parse_address
 
-game = load_from_file(trackpath)
-game._cars_per_generation = populaton_size
-game.init()
-game.evolve()
\ No newline at end of file
+        # Build the sensor table (if any) once, before the islands need it
+        game._headless = True
+        game.init()
+        settings = dict(
+            options=game.simulation_options(),
+            size=args.population_size,
+            parent_cutoff=game._parent_cutoff,
+            mutation_rate=game._mutation_rate,
+            selection=game._selection,
+            migrate_every=args.migrate_every,
+            migrants=args.migrants,
+        )
+        if args.listen is not None:
+            transport = SocketTransport(parse_address(args.listen), parse_address(args.peer))
+            trackfile = args.bundle if args.bundle is not None else args.track
+            run_island(trackfile, transport, seed=args.seed, name=f"Island {args.listen}", **settings)
+        else:
+            # The islands all share this process' copy of the track
+            run_islands(game.worker_track(), args.islands, seed=args.seed, **settings)
+    else:
+        game.init()
+        if args.resume is not None:
+            game.resume(args.resume)
+        game.evolve()
+
+if __name__ == "__main__":
+    main()
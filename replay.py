@@ -0,0 +1,128 @@
+import argparse
+import json
+import sys
+
+import numpy as np
+import pygame
+from pygame.locals import K_SPACE, K_LEFT, K_RIGHT, K_UP, K_DOWN, K_HOME, K_END, K_n, K_p
+
+from src.game.car import Car
+from src.game.game import get_font
+from src.game.recording import Recording
+from src.game.track import Track
+from src.game.simulation import TICKS_PER_SECOND
+
+# Watch a generation from a recording made with evolve.py --record,
+# drawn from the recorded poses - nothing is simulated again.
+#
+#   SPACE pauses, LEFT and RIGHT skip back and forward a second,
+#   HOME and END jump to the start and end, UP and DOWN double and
+#   halve the speed, and N and P move to the next and previous
+#   recorded generation.
+
+parser = argparse.ArgumentParser(description="Replay a generation recorded with evolve.py --record")
+parser.add_argument("recording", help="the file given to evolve.py --record")
+parser.add_argument("--generation", type=int, default=None, help="the generation to watch (by default the latest)")
+parser.add_argument("--car", type=int, action="append", default=None, help="only show this car (by its index in the generation) - can be given more than once")
+parser.add_argument("--top", type=int, default=None, help="only show this many of the best scoring cars")
+parser.add_argument("--speed", type=float, default=1.0, help="how many times faster than real time to play")
+parser.add_argument("--start", type=float, default=0.0, help="the second to start playing from")
+args = parser.parse_args()
+
+recording = Recording(args.recording)
+if len(recording) == 0:
+    print(f"{args.recording} has no finished generations yet")
+    sys.exit()
+index = recording.find(args.generation) if args.generation is not None else len(recording) - 1
+
+with open(recording.trackfile, "r") as readfile:
+    settings = json.load(readfile)
+
+pygame.init()
+track = Track(settings["trackname"])
+display = pygame.display.set_mode(track.get_size())
+pygame.display.set_caption("Car Game - Replay")
+background = pygame.Surface(display.get_size()).convert()
+background.fill((69, 68, 67))
+background.blit(track.surf, track.rect)
+clock = pygame.time.Clock()
+
+# Load a recorded generation, returning its poses, the indexes of
+# the cars to show (best last, so it's drawn on top) and their Cars
+def load_generation(index : int):
+    generation = recording.generations[index]
+    poses = recording.poses(index)
+    scores = np.array(generation["scores"])
+    if args.car is not None:
+        shown = np.array([car for car in args.car if car < generation["cars"]], dtype=np.int64)
+        shown = shown[np.argsort(scores[shown], kind='stable')]
+    else:
+        shown = np.argsort(-scores, kind='stable')
+        if args.top is not None:
+            shown = shown[:args.top]
+        shown = shown[::-1]
+    cars = []
+    for car in shown:
+        pose = poses[0, car]
+        cars.append(Car((float(pose["x"]), float(pose["y"])), float(pose["rotation"]), color=tuple(generation["colors"][car])))
+    return generation, poses, shown, cars
+
+# How many of the recorded poses make up a second
+def poses_per_second(generation : dict) -> float:
+    return TICKS_PER_SECOND / generation.get("timestep", 1)
+
+generation, poses, shown, cars = load_generation(index)
+tick = min(args.start * poses_per_second(generation), len(poses) - 1)
+speed = args.speed
+paused = False
+running = True
+
+while running:
+    for event in pygame.event.get():
+        if event.type == pygame.QUIT:
+            running = False
+        elif event.type == pygame.KEYDOWN:
+            if event.key == K_SPACE:
+                paused = not paused
+            elif event.key == K_RIGHT:
+                tick += poses_per_second(generation)
+            elif event.key == K_LEFT:
+                tick -= poses_per_second(generation)
+            elif event.key == K_HOME:
+                tick = 0
+            elif event.key == K_END:
+                tick = len(poses) - 1
+            elif event.key == K_UP:
+                speed *= 2
+            elif event.key == K_DOWN:
+                speed /= 2
+            elif event.key in (K_n, K_p):
+                step = 1 if event.key == K_n else -1
+                if 0 <= index + step < len(recording):
+                    index += step
+                    generation, poses, shown, cars = load_generation(index)
+                    tick = 0
+
+    tick = min(max(tick, 0), len(poses) - 1)
+    frame = poses[int(tick)]
+
+    display.blit(background, (0, 0))
+    for car, pose in zip(cars, frame[shown]):
+        car.set_state((float(pose["x"]), float(pose["y"])), float(pose["rotation"]), float(pose["speed"]), not pose["alive"], 0)
+        car.render()
+        display.blit(car.surf, car.rect)
+
+    status = "paused" if paused else f"{speed:g}x"
+    title = get_font().render(f"Generation {generation['generation']} - {tick / poses_per_second(generation):.1f}s of {(len(poses) - 1) / poses_per_second(generation):.1f}s - {status}", True, (255, 255, 255))
+    display.blit(title, (10, 10))
+    best = shown[-1] if len(shown) > 0 else None
+    if best is not None:
+        best_title = get_font().render(f"Best shown: car {best} scored {generation['scores'][best]}", True, (255, 255, 255))
+        display.blit(best_title, (10, 40))
+    pygame.display.update()
+
+    if not paused:
+        tick += speed * poses_per_second(generation) / TICKS_PER_SECOND
+    clock.tick(TICKS_PER_SECOND)
+
+pygame.quit()
@@ -0,0 +1,40 @@
+import pygame
+from collections import OrderedDict
+
+# A SpriteAtlas holds pre-rotated copies of the car sprite, for each
+# color and each rotation bin, shared by every car. Rotations are
+# only made the first time they are asked for, and when there are
+# more colors than max_colors the least recently drawn color (and
+# all of its rotations) is dropped.
+#
+# make_sprite is called with a color to create the unrotated
+# sprite for that color.
+class SpriteAtlas():
+
+    def __init__(self, make_sprite, bins : int = 360, max_colors : int = 1024):
+        self._make_sprite = make_sprite
+        self._bins = bins
+        self._max_colors = max_colors
+        self._colors = OrderedDict()
+
+    def __len__(self):
+        return len(self._colors)
+
+    def _entry(self, color):
+        color = tuple(int(channel) for channel in color)
+        if color in self._colors:
+            self._colors.move_to_end(color)
+            return self._colors[color]
+
+        entry = {"sprite": self._make_sprite(color), "rotations": {}}
+        self._colors[color] = entry
+        if len(self._colors) > self._max_colors:
+            self._colors.popitem(last=False)
+        return entry
+
+    def get(self, color, rotation : float):
+        entry = self._entry(color)
+        rotation_bin = int(round(rotation * self._bins / 360)) % self._bins
+        if rotation_bin not in entry["rotations"]:
+            entry["rotations"][rotation_bin] = pygame.transform.rotate(entry["sprite"], rotation_bin * 360 / self._bins)
+        return entry["rotations"][rotation_bin]
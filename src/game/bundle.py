@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+from .collision import FootprintCollider
+from .sensing import RaySensor, load_sensor_table, DISTANCE_ANGLES
+from .simulation import Simulation, TICK_LIMIT
+from .stalling import StallRules
+
+# A track bundle is a track compiled down to just what a Simulation
+# needs: the wall and collision grids, the car's collision footprint,
+# the checkpoint and finish line segments and the spawn pose. Loading
+# one means memory mapping a single file and unpacking its grids -
+# there is no PNG to decode and, unlike load_from_file, pygame is
+# never imported - so worker processes and islands start almost
+# instantly. The grids are bit-packed on disk, so each load does make
+# an unpacked copy of them - to share one copy between processes, see
+# shared.py.
+#
+# The file is laid out as:
+#   MAGIC, then the length of the header as a little endian uint64
+#   a JSON header, padded with spaces to a multiple of ALIGNMENT
+#   the occupancy, solid and footprint grids, each bit-packed with
+#   np.packbits and padded to a multiple of ALIGNMENT
+# The header holds the geometry, the shape and offset of each grid,
+# and a content hash of all of it, which is checked on load.
+MAGIC = b"EVOTRAK1"
+ALIGNMENT = 64
+BUNDLE_EXTENSION = ".bundle"
+GRIDS = ("occupancy", "solid", "footprint")
+
+class TrackBundle():
+
+    def __init__(
+        self,
+        occupancy,
+        solid,
+        footprint,
+        checkpoints : [((int, int), (int, int))],
+        finishline : ((int, int), (int, int)),
+        spawn_position : (int, int),
+        spawn_rotation : float,
+        image_hash : str = None,
+        content_hash : str = None,
+        filepath : str = None,
+        free_index = None
+        ):
+        self.occupancy = occupancy
+        self.solid = solid
+        self.footprint = footprint
+        self.checkpoints = checkpoints
+        self.finishline = finishline
+        self.spawn_position = spawn_position
+        self.spawn_rotation = spawn_rotation
+        self.image_hash = image_hash
+        self.content_hash = content_hash
+        self._filepath = filepath
+        # The occupancy's sensing.free_pixel_index, if it has already
+        # been worked out (ie shared by another process)
+        self.free_index = free_index
+
+    # Everything but the grids, as can be saved as JSON
+    def geometry(self) -> dict:
+        return {
+            "checkpoints": [[list(start), list(end)] for start, end in self.checkpoints],
+            "finish_line": [list(point) for point in self.finishline],
+            "spawn_position": list(self.spawn_position),
+            "spawn_rotation": self.spawn_rotation,
+            "image_hash": self.image_hash,
+        }
+
+    # Build a headless Simulation of the track. options are the same
+    # Game attributes that load_simulation takes - see
+    # Game.simulation_options.
+    def create_simulation(self, options : dict = {}) -> Simulation:
+        sensor_range = options.get("_sensor_range")
+        resolution = options.get("_sensor_resolution")
+        if resolution is None:
+            sensor = RaySensor(self.occupancy, DISTANCE_ANGLES, max_range=sensor_range)
+        else:
+            # The same table the Game builds for the track, as both
+            # come from the same image
+            dtype = options.get("_sensor_dtype", "uint16")
+            base = f"{os.path.splitext(self._filepath)[0]}.sensors-{resolution:g}deg-{dtype}"
+            sensor = load_sensor_table(base, self.occupancy, self.image_hash, resolution=resolution, dtype=dtype, angles=DISTANCE_ANGLES, max_range=sensor_range, index=self.free_index)
+
+        stall_rules = None
+        if options.get("_stall_ticks") is not None or options.get("_stall_window") is not None:
+            stall_rules = StallRules(options.get("_stall_ticks"), options.get("_stall_window"), options.get("_stall_distance", 20))
+
+        return Simulation(
+            sensor,
+            FootprintCollider(self.footprint, self.solid),
+            self.checkpoints,
+            self.finishline,
+            self.spawn_position,
+            self.spawn_rotation,
+            tick_limit=options.get("_tick_limit") or TICK_LIMIT,
+            stall_rules=stall_rules,
+            timestep=options.get("_timestep", 1),
+            substeps=options.get("_substeps", 1)
+        )
+
+# The bundle for an initialized Game (see load_from_file)
+def bundle_from_game(game) -> TrackBundle:
+    from .car import get_footprint
+    return TrackBundle(
+        game._track.occupancy,
+        game._track.solid,
+        get_footprint(),
+        [(checkpoint._start_at, checkpoint._end_at) for checkpoint in game._checkpoints],
+        (game._finishline._start_at, game._finishline._end_at),
+        game._car_spawn_position,
+        game._car_spawn_rotation,
+        image_hash=game._track.image_hash(),
+        filepath=game._trackfile
+    )
+
+def compile_bundle(game, filepath : str):
+    bundle = bundle_from_game(game)
+    save_bundle(filepath, bundle.geometry(), {name: getattr(bundle, name) for name in GRIDS})
+
+# A hash of the geometry and the packed grids (by name) of the given
+# shapes
+def content_hash(geometry : dict, shapes : dict, packed : dict) -> str:
+    content = hashlib.sha256(json.dumps(geometry, sort_keys=True).encode())
+    for name in GRIDS:
+        content.update(str(tuple(shapes[name])).encode())
+        content.update(np.asarray(packed[name]).tobytes())
+    return content.hexdigest()
+
+def save_bundle(filepath : str, geometry : dict, grids : dict):
+    packed = {name: np.packbits(np.asarray(grids[name], dtype=bool), axis=None) for name in GRIDS}
+    shapes = {name: grids[name].shape for name in GRIDS}
+
+    # Grid offsets are from the end of the (padded) header
+    header = dict(geometry, content_hash=content_hash(geometry, shapes, packed), grids={})
+    offset = 0
+    for name in GRIDS:
+        header["grids"][name] = {"shape": list(grids[name].shape), "offset": offset}
+        offset += packed[name].nbytes
+        offset += -offset % ALIGNMENT
+
+    encoded = json.dumps(header).encode()
+    start = len(MAGIC) + 8
+    encoded += b" " * (-(start + len(encoded)) % ALIGNMENT)
+
+    # Written in full and then swapped in, so a half written bundle
+    # is never loaded
+    temporary = filepath + ".tmp"
+    with open(temporary, "wb") as writefile:
+        writefile.write(MAGIC + struct.pack("<Q", len(encoded)) + encoded)
+        for name in GRIDS:
+            data = packed[name].tobytes()
+            writefile.write(data + b"\0" * (-len(data) % ALIGNMENT))
+    os.replace(temporary, filepath)
+
+def load_bundle(filepath : str) -> TrackBundle:
+    with open(filepath, "rb") as readfile:
+        if readfile.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{filepath} is not a track bundle")
+        (length,) = struct.unpack("<Q", readfile.read(8))
+        header = json.loads(readfile.read(length))
+
+    data = np.memmap(filepath, dtype=np.uint8, mode="r", offset=len(MAGIC) + 8 + length)
+    shapes = {}
+    packed = {}
+    for name in GRIDS:
+        shapes[name] = tuple(header["grids"][name]["shape"])
+        offset = header["grids"][name]["offset"]
+        packed[name] = data[offset:offset + (int(np.prod(shapes[name])) + 7) // 8]
+
+    # A stale or damaged bundle would otherwise load without complaint
+    geometry = {key: value for key, value in header.items() if key not in ("content_hash", "grids")}
+    if content_hash(geometry, shapes, packed) != header["content_hash"]:
+        raise ValueError(f"{filepath} is corrupt - its contents don't match its hash")
+
+    grids = {}
+    for name in GRIDS:
+        count = int(np.prod(shapes[name]))
+        grids[name] = np.unpackbits(packed[name], count=count).reshape(shapes[name]).view(bool)
+
+    return from_geometry(header, grids, content_hash=header["content_hash"], filepath=filepath)
+
+def from_geometry(geometry : dict, grids : dict, content_hash : str = None, filepath : str = None) -> TrackBundle:
+    return TrackBundle(
+        grids["occupancy"],
+        grids["solid"],
+        grids["footprint"],
+        [(tuple(start), tuple(end)) for start, end in geometry["checkpoints"]],
+        tuple(tuple(point) for point in geometry["finish_line"]),
+        tuple(geometry["spawn_position"]),
+        geometry["spawn_rotation"],
+        image_hash=geometry["image_hash"],
+        content_hash=content_hash,
+        filepath=filepath,
+        free_index=grids.get("free_index")
+    )
+
+# Load a Simulation from a track bundle, a shared track (given its
+# SharedTrack.descriptor - see shared.py) or, with pygame, a
+# track.json file
+def load_simulation(filepath, options : dict = {}) -> Simulation:
+    if isinstance(filepath, dict):
+        from .shared import attach_track
+        return attach_track(filepath).bundle().create_simulation(options)
+    if filepath.endswith(BUNDLE_EXTENSION):
+        return load_bundle(filepath).create_simulation(options)
+    from .game import load_simulation as load_game_simulation
+    return load_game_simulation(filepath, options)
@@ -2,20 +2,52 @@ import pygame
 vector = pygame.math.Vector2
 from PIL import Image
 import numpy as np
+from math import radians, cos, sin, ceil
 from random import uniform, randint
 from pygame.locals import K_LEFT, K_RIGHT, K_UP, K_DOWN
-from uuid import uuid4 as uuid
+from itertools import count
 
+from .atlas import SpriteAtlas
 from .checkpoint import Checkpoint
 from .nn import NN
 from .nn import mate as nn_mate
+from .scoring import CRASH, CHECKPOINT, NO_CHECKPOINTS
 
-im = Image.open('assets/car_sprite.png')
-im = im.resize((28, 14))
+SPRITE_PATH = 'assets/car_sprite.png'
+SPRITE_SIZE = (28, 14)
+
+# The car sprite is only loaded the first time it is needed, so
+# importing this module stays cheap
+_sprite_image = None
+
+def get_sprite_image():
+    global _sprite_image
+    if _sprite_image is None:
+        _sprite_image = Image.open(SPRITE_PATH).resize(SPRITE_SIZE)
+    return _sprite_image
+
+# Cheap unique ids for cars
+car_ids = count()
+
+# The pixels of the car sprite that count for collisions - the same
+# alpha threshold that pygame.mask.from_surface uses
+def get_footprint():
+    return np.array(get_sprite_image())[:, :, 3] > 127
+
+# Replace the "white" of the car sprite with the given color
+def tint_sprite(color):
+    imagedata = np.array(get_sprite_image())
+    red, green, blue = imagedata[:,:,0], imagedata[:,:,1], imagedata[:,:,2]
+    mask = (red > 250) & (green > 250) & (blue > 250)
+    imagedata[:,:,:3][mask] = [color[0], color[1], color[2]]
+    imagedata = imagedata.astype('uint8')
+    shape = (imagedata.shape[1], imagedata.shape[0])
+    # Copy so the surface doesn't depend on the lifetime of imagedata
+    return pygame.image.frombuffer(imagedata.tobytes(), shape, 'RGBA').copy()
+
+# Every car draws from the same set of pre-rotated sprites
+atlas = SpriteAtlas(tint_sprite)
 
-CRASH = -50
-CHECKPOINT = 150
-NO_CHECKPOINTS = -100
 
 class Car(pygame.sprite.Sprite):
 
@@ -28,46 +60,44 @@ class Car(pygame.sprite.Sprite):
         ):
         super().__init__()
 
-        self._id = uuid()
+        self.surf = None
+        self.rect = None
+        self.respawn(position, rotation, color=color, nn=nn)
 
-        self._crashed = False
+    # Reinitialize the car in place - as if it was a brand new car -
+    # so that cars can be reused (see CarPool). The sprite for the
+    # car's color is only made when the car is first drawn.
+    def respawn(
+        self,
+        position : (int, int),
+        rotation : int = 0,
+        color : (int, int, int) = None,
+        nn = None
+        ):
+        self._id = next(car_ids)
 
-        self._position = position
-        self._rotation = rotation
         self._initial_position = position
         self._initial_rotation = rotation
 
         if color is None:
             color =  list(np.random.choice(range(256), size=3))
         self._color = color
-        # replace that car color of "white" with the chosen color
-        imagedata = np.array(im)
-        red, green, blue = imagedata[:,:,0], imagedata[:,:,1], imagedata[:,:,2]
-        mask = (red > 250) & (green > 250) & (blue > 250)
-        imagedata[:,:,:3][mask] = [color[0], color[1], color[2]]
-
-        self._image_shape = (imagedata.shape[0:2][1], imagedata.shape[0:2][0])
-        self._image_data = imagedata.astype('uint8')
-
-        self.surf = pygame.image.frombuffer(self._image_data, self._image_shape, 'RGBA')
-        self.image = self.surf
-        self.rect = self.surf.get_rect(center = self._position)
-    
-        self._velocity = vector(0,0)
-        self._acceleration = vector(0,0)
-
-        self._score = 0
-
-        self._checkpoints = {}
-
-        self._distances = {}
-        self._distance_endpoints = {}
 
         if nn is None:
             self._nn = NN()
         else:
             self._nn = nn
 
+        self.reset()
+
+    # This is obtuse but it's how mask collisions work - they look
+    # for an image attribute, which we only render when asked for
+    @property
+    def image(self):
+        if self.surf is None:
+            self.render()
+        return self.surf
+
     def get_center(self):
         return self._position
 
@@ -91,8 +121,11 @@ class Car(pygame.sprite.Sprite):
 
         return acceleration, rotation
 
-    def get_nn_move(self):
-        orders = self._nn.infer(self._velocity.magnitude(), self._rotation, self._distances)
+    # orders can be passed in if the NN has already been run for this
+    # car (ie. by a PopulationNN), otherwise we run the car's own NN
+    def get_nn_move(self, orders=None):
+        if orders is None:
+            orders = self._nn.infer(self._velocity.magnitude(), self._rotation, self._distances)
         orders = orders >= 0.5
         # orders is the NN output with the following outputs
         # 1. acceleration
@@ -147,9 +180,7 @@ class Car(pygame.sprite.Sprite):
         self._position += self._velocity
 
     def render(self):
-        surface = pygame.image.frombuffer(self._image_data, self._image_shape, 'RGBA')
-        self.surf = pygame.transform.rotate(surface, self._rotation)
-        self.image = self.surf # This is obtuse but it's how mask collisions work
+        self.surf = atlas.get(self._color, self._rotation)
         self.rect = self.surf.get_rect(center = self._position)
 
     def crash(self, seconds_since_start : int):
@@ -173,6 +204,27 @@ class Car(pygame.sprite.Sprite):
         if len(self._checkpoints) == 0:
             self._score += NO_CHECKPOINTS
 
+    # Used when the car is being simulated as part of a Population
+    def set_state(self, position, rotation, speed, crashed, score):
+        self._position = vector(float(position[0]), float(position[1]))
+        self._rotation = float(rotation)
+        self._velocity = vector(float(speed), 0).rotate(-self._rotation)
+        self._crashed = crashed
+        self._score = score
+        self.update_rect()
+
+    # Position the car's rect as render would, but without rotating
+    # the sprite - the rotated size is worked out from the angle.
+    def update_rect(self):
+        angle = radians(self._rotation)
+        width, height = SPRITE_SIZE
+        size = (
+            ceil(abs(width * cos(angle)) + abs(height * sin(angle))),
+            ceil(abs(width * sin(angle)) + abs(height * cos(angle))),
+        )
+        self.rect = pygame.Rect((0, 0), size)
+        self.rect.center = self._position
+
     def add_distance(self, angle, end_point, distance):
         self._distance_endpoints[angle] = end_point
         self._distances[angle] = distance
@@ -187,9 +239,31 @@ class Car(pygame.sprite.Sprite):
         self._checkpoints = {}
         self._distances = {}
         self._distance_endpoints = {}
-        self.render() # This reset the rectangle position for collision detection
+        self.surf = None
+        self.update_rect() # This reset the rectangle position for collision detection
+
+# A CarPool keeps cars that are no longer needed around so that
+# they can be respawned with a new NN rather than creating new ones.
+class CarPool():
+
+    def __init__(self):
+        self._cars = []
+
+    def __len__(self):
+        return len(self._cars)
+
+    def get(self, position : (int, int), rotation : int = 0, color : (int, int, int) = None, nn = None) -> Car:
+        if len(self._cars) == 0:
+            return Car(position, rotation, color=color, nn=nn)
+        car = self._cars.pop()
+        car.respawn(position, rotation, color=color, nn=nn)
+        return car
+
+    def release(self, car : Car):
+        car.kill() # Remove it from any sprite groups
+        self._cars.append(car)
 
-def mate(a : Car, b : Car, a_parentage : float = 0.50, mutation : float = 0.05):
+def mate(a : Car, b : Car, a_parentage : float = 0.50, mutation : float = 0.05, pool : CarPool = None):
     # For fun, blend the colors
     # color = [0, 0, 0]
     # for index, channel in enumerate(color):
@@ -203,4 +277,6 @@ def mate(a : Car, b : Car, a_parentage : float = 0.50, mutation : float = 0.05):
 
     nn = nn_mate(a._nn, b._nn, a_parentage=a_parentage, mutation=mutation)
 
+    if pool is not None:
+        return pool.get(a._initial_position, a._initial_rotation, nn=nn)
     return Car(a._initial_position, a._initial_rotation, nn=nn)
\ No newline at end of file
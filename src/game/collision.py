@@ -0,0 +1,118 @@
+import numpy as np
+
+# Footprints only have to be worked out once per process
+_footprints = {}
+
+# Work out which pixels, relative to the car's center, the car's
+# sprite covers when rotated to each of the given number of evenly
+# spaced rotations. mask is the (height, width) boolean footprint
+# of the unrotated sprite (see car.get_footprint).
+#
+# Like pygame.transform.rotate we go from the rotated pixel back to
+# the source pixel it came from, so the footprint never has holes.
+# Walls can't appear inside a car without crossing its edge first,
+# so only the outline of each footprint is kept.
+# Returns a (bins, points, 2) array of [x, y] offsets - every bin is
+# padded out to the same number of points by repeating its first.
+def rotated_footprints(mask, bins : int = 360):
+    key = (bins, mask.shape, mask.tobytes())
+    if key in _footprints:
+        return _footprints[key]
+
+    height, width = mask.shape
+    radius = int(np.ceil(np.hypot(width, height) / 2)) + 1
+    grid = np.arange(-radius, radius + 1)
+    offset_x, offset_y = np.meshgrid(grid, grid, indexing='ij')
+    offset_x = offset_x.ravel()
+    offset_y = offset_y.ravel()
+    # The centers of each pixel
+    center_x = offset_x + 0.5
+    center_y = offset_y + 0.5
+
+    footprints = []
+    for rotation in range(bins):
+        # Sprites are rotated counter clockwise, with y pointing down
+        radians = np.radians(rotation * 360 / bins)
+        u = center_x * np.cos(radians) - center_y * np.sin(radians)
+        v = center_x * np.sin(radians) + center_y * np.cos(radians)
+        source_x = np.floor(u + width / 2).astype(np.int64)
+        source_y = np.floor(v + height / 2).astype(np.int64)
+        inside = (source_x >= 0) & (source_x < width) & (source_y >= 0) & (source_y < height)
+        covered = np.zeros(len(u), dtype=bool)
+        covered[inside] = mask[source_y[inside], source_x[inside]]
+
+        # Keep the covered pixels that have an uncovered neighbour
+        covered = covered.reshape(len(grid), len(grid))
+        bordered = np.pad(covered, 1)
+        interior = bordered[:-2, 1:-1] & bordered[2:, 1:-1] & bordered[1:-1, :-2] & bordered[1:-1, 2:]
+        outline = (covered & ~interior).ravel()
+        footprints.append(np.stack((offset_x[outline], offset_y[outline]), axis=1))
+
+    points = max(len(footprint) for footprint in footprints)
+    padded = np.empty((bins, points, 2), dtype=np.int64)
+    for rotation, footprint in enumerate(footprints):
+        padded[rotation, :len(footprint)] = footprint
+        padded[rotation, len(footprint):] = footprint[0]
+
+    _footprints[key] = padded
+    return padded
+
+# FootprintCollider decides whether cars have hit a wall without
+# ever touching their sprites. Each car's rotation is rounded to the
+# nearest footprint bin and every pixel of that footprint is looked
+# up in the track's solid array at once, for all cars together.
+# Leaving the track entirely counts as a crash.
+class FootprintCollider():
+
+    def __init__(self, mask, solid, bins : int = 360):
+        self._footprints = rotated_footprints(mask, bins)
+        self._bins = bins
+        self._solid = solid
+
+    # Given (n, 2) positions and (n,) rotations, returns a (n,) boolean
+    # array of which cars are touching a wall.
+    def collides(self, positions, rotations):
+        width, height = self._solid.shape
+        positions = np.asarray(positions)
+        rotation = np.rint(np.asarray(rotations) * self._bins / 360).astype(np.int64) % self._bins
+        footprint = self._footprints[rotation]
+
+        x = np.rint(positions[:, 0]).astype(np.int64)[:, None] + footprint[:, :, 0]
+        y = np.rint(positions[:, 1]).astype(np.int64)[:, None] + footprint[:, :, 1]
+        outside = (x < 0) | (x >= width) | (y < 0) | (y >= height)
+        np.clip(x, 0, width - 1, out=x)
+        np.clip(y, 0, height - 1, out=y)
+
+        return (self._solid[x, y] | outside).any(axis=1)
+
+    # Like collides, but for cars that moved in a straight line from
+    # previous to current (at their given rotations). Each car's path
+    # is checked at its number of samples evenly spaced points, the
+    # last being current, so a car that moved further than it is wide
+    # can't pass through a wall. Returns a (n,) boolean array of which
+    # cars hit a wall, and the (n, 2) positions where each first did
+    # (or current, for the cars that didn't).
+    def sweep(self, previous, current, rotations, samples):
+        previous = np.asarray(previous)
+        current = np.asarray(current)
+        rotations = np.asarray(rotations)
+        samples = np.asarray(samples)
+        crashed = np.zeros(len(current), dtype=bool)
+        contacts = current.copy()
+
+        checking = np.arange(len(current))
+        sample = 1
+        while len(checking) > 0:
+            last = samples[checking] == sample
+            points = np.where(
+                last[:, None],
+                current[checking],
+                previous[checking] + (current[checking] - previous[checking]) * (sample / samples[checking])[:, None]
+            )
+            hit = self.collides(points, rotations[checking])
+            crashed[checking[hit]] = True
+            contacts[checking[hit]] = points[hit]
+            checking = checking[~hit & ~last]
+            sample += 1
+
+        return crashed, contacts
@@ -0,0 +1,19 @@
+import numpy as np
+
+from .nn import NN, to_genomes, from_genome, mate_genomes
+from .selection import select_pairs, mate_counts
+
+# Breed count children from the given parents (best first) and their
+# scores. Parents are paired up with the given selection method (see
+# selection.py), and a parent never mates with itself.
+# Returns the children's NNs and an array of how many times each
+# parent (by index) mated. The children's weights are all drawn from
+# rng at once, see nn.mate_genomes.
+def breed(parents : [NN], scores : [int], count : int, mutation : float, rng : np.random.Generator = None, selection : str = "proportional"):
+    if rng is None:
+        rng = np.random.default_rng()
+    a, b = select_pairs(scores, count, rng, method=selection)
+    genomes = mate_genomes(to_genomes(parents), a, b, mutation=mutation, rng=rng)
+    children = [from_genome(genome) for genome in genomes]
+
+    return children, mate_counts(a, b, len(parents))
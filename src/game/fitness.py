@@ -0,0 +1,76 @@
+import hashlib
+import json
+from collections import OrderedDict
+
+import numpy as np
+
+# The simulation has no randomness, so a genome driven on the same
+# track with the same settings always earns the same score. The
+# FitnessCache remembers the scores of genomes it has seen - the
+# parents carried over each generation, and children that came out
+# identical to a parent - so only new genomes need to be simulated.
+#
+# Entries are keyed by a hash of the genome's weights and of config,
+# which should hold everything else that affects the score (see
+# config_digest). Once there are more than max_size entries the
+# least recently used are dropped.
+class FitnessCache():
+
+    def __init__(self, config : bytes = b"", max_size : int = 100000):
+        self._config = config
+        self._max_size = max_size
+        self._scores = OrderedDict()
+        # How many genomes have been scored from the cache, and how
+        # many had to be simulated
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._scores)
+
+    def key(self, genome) -> bytes:
+        genome = np.ascontiguousarray(genome, dtype=np.float64)
+        return hashlib.blake2b(self._config + genome.tobytes(), digest_size=16).digest()
+
+    # Score a (pop, GENOME_SIZE) matrix of genomes. score is called
+    # with the matrix of just the genomes that aren't cached (each
+    # only once, if repeated) and must return their scores. With
+    # force, every genome is simulated again and the cache updated.
+    def evaluate(self, genomes, score, force : bool = False):
+        genomes = np.asarray(genomes)
+        keys = [self.key(genome) for genome in genomes]
+
+        results = {}
+        missing = {}
+        for index, key in enumerate(keys):
+            if key in results or key in missing:
+                continue
+            if not force and key in self._scores:
+                self._scores.move_to_end(key)
+                results[key] = self._scores[key]
+            else:
+                missing[key] = index
+
+        self.hits += len(genomes) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            scored = score(genomes[list(missing.values())])
+            for key, result in zip(missing, scored):
+                results[key] = int(result)
+                self._scores[key] = int(result)
+                self._scores.move_to_end(key)
+            while len(self._scores) > self._max_size:
+                self._scores.popitem(last=False)
+
+        return np.array([results[key] for key in keys], dtype=np.int64)
+
+# Hash together everything other than the genome that decides a
+# score - ie the track file, the track image, and the simulation
+# options - into a config for FitnessCache
+def config_digest(*parts) -> bytes:
+    digest = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = json.dumps(part, sort_keys=True).encode()
+        digest.update(part)
+    return digest.digest()
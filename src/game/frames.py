@@ -0,0 +1,84 @@
+import threading
+
+import numpy as np
+
+# A Frame is what's needed to draw a Population at one tick - a copy,
+# so it can be drawn while the Population carries on changing.
+class Frame():
+
+    def __init__(self, size : int):
+        self.tick = 0
+        self.positions = np.zeros((size, 2), dtype=np.float64)
+        self.rotations = np.zeros(size, dtype=np.float64)
+        self.speeds = np.zeros(size, dtype=np.float64)
+        self.alive = np.ones(size, dtype=bool)
+        self.scores = np.zeros(size, dtype=np.int64)
+        # Only copied when they are going to be drawn, otherwise None
+        self.endpoints = None
+        self._endpoints = None
+
+    def copy_from(self, population, tick : int, endpoints : bool = False):
+        self.tick = tick
+        np.copyto(self.positions, population.positions)
+        np.copyto(self.rotations, population.rotations)
+        np.copyto(self.speeds, population.speeds)
+        np.copyto(self.alive, population.alive)
+        np.copyto(self.scores, population.scores)
+        if endpoints:
+            if self._endpoints is None:
+                self._endpoints = np.empty_like(population.endpoints)
+            np.copyto(self._endpoints, population.endpoints)
+            self.endpoints = self._endpoints
+        else:
+            self.endpoints = None
+
+    # The same as Population.sync, from the copy
+    def sync(self, cars):
+        for index, car in enumerate(cars):
+            car.set_state(
+                self.positions[index],
+                self.rotations[index],
+                self.speeds[index],
+                not self.alive[index],
+                int(self.scores[index])
+            )
+
+# Hands Frames from the thread running a Simulation to the thread
+# drawing it, without either waiting on the other. There are three
+# Frames: the one being drawn, the one waiting to be drawn and the one
+# being written. publish only copies the Population when the last
+# published Frame has been taken, so no time is spent on frames that
+# would never be seen - the simulation can run thousands of ticks
+# between two frames, and the drawing thread is always handed the
+# state from just after it last looked.
+class FrameBuffer():
+
+    def __init__(self, size : int):
+        self._lock = threading.Lock()
+        self._back = Frame(size)
+        self._ready = Frame(size)
+        self._front = Frame(size)
+        self._fresh = False
+        # The Frame last taken by latest, or None before the first
+        self.shown = None
+
+    # Returns whether a Frame was published
+    def publish(self, population, tick : int, endpoints : bool = False) -> bool:
+        if self._fresh:
+            return False
+        self._back.copy_from(population, tick, endpoints)
+        with self._lock:
+            self._back, self._ready = self._ready, self._back
+            self._fresh = True
+        return True
+
+    # The newest published Frame, or None if there hasn't been one
+    # since the last call
+    def latest(self) -> Frame:
+        with self._lock:
+            if not self._fresh:
+                return None
+            self._front, self._ready = self._ready, self._front
+            self._fresh = False
+        self.shown = self._front
+        return self._front
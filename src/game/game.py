@@ -1,33 +1,120 @@
 import pygame
 from pygame.locals import *
 import math
-from pygame.locals import K_d, K_RETURN, K_c, K_n, K_MINUS, K_EQUALS, K_LEFTBRACKET, K_RIGHTBRACKET
+from pygame.locals import K_d, K_RETURN, K_c, K_n, K_t, K_MINUS, K_EQUALS, K_LEFTBRACKET, K_RIGHTBRACKET
 import time
-from random import uniform, choices
+import os
+import threading
+import heapq
+import random
 from pprint import pprint
 import json
+import numpy as np
+from time import perf_counter
 
 from .car import Car
-from .car import mate as car_mate
+from .car import CarPool
+from .car import get_footprint
+from .collision import FootprintCollider
+from .nn import to_genomes, from_genome
 from .checkpoint import Checkpoint
 from .finishline import FinishLine
 from .track import Track
+from .sensing import RaySensor, DISTANCE_ANGLES
+from .evolution import breed
+from .simulation import Simulation, TICKS_PER_SECOND, TICK_LIMIT
+from .parallel import ParallelEvaluator
+from .stalling import StallRules
+from .fitness import FitnessCache, config_digest
+from .profiling import PhaseTimer, TimingExporter, profile
+from .snapshot import Snapshot, SnapshotWriter, load_snapshot
+from .bundle import bundle_from_game, load_bundle
+from .shared import publish_track
+from .recording import TrajectoryRecorder
+from .frames import FrameBuffer
 
 MANUAL_MODE = "manual"
 EVOLVE_MODE = "evolve"
-TIME_LIMIT = 60
 
-pygame.font.init()
-font = pygame.font.SysFont(None, 32)
+# How fast the simulation runs when it has its own thread - a tick per
+# frame, to watch, or as fast as it can go
+WATCH_PACING = "watch"
+TURBO_PACING = "turbo"
+
+# Fonts are only loaded once something is drawn, so that headless
+# runs never touch pygame's font machinery
+font = None
+
+def get_font():
+    global font
+    if font is None:
+        pygame.font.init()
+        font = pygame.font.SysFont(None, 32)
+    return font
 
 class Game:
-    def __init__(self, trackname : str, mode : str = MANUAL_MODE, cars_per_generation=25):
+    def __init__(self, trackname : str, mode : str = MANUAL_MODE, cars_per_generation=25, headless : bool = False, seed : int = None):
         self._running = True
+        # In headless mode no window is ever created and nothing is
+        # drawn - the simulation simply runs as fast as it can.
+        self._headless = headless
         self._display_surface = None
+        # The track with every crashed car already drawn on it, as
+        # crashed cars never move again, and the areas drawn over it
+        # last frame. See on_render.
+        self._background = None
+        self._background_key = None
+        self._background_cars = set()
+        self._dirty_rects = []
+        # The rendered text of each line of the HUD, by its position
+        self._hud = {}
+        # If set, only this many of the best scoring cars are drawn,
+        # and with _draw_alive_only, no crashed cars
+        self._draw_top = None
+        self._draw_alive_only = False
         self._frame_per_sec = pygame.time.Clock()
         self._fps = 60
+        # With _render_thread, evolve mode runs each generation's
+        # Simulation on a thread of its own, paced by _pacing, while
+        # this thread draws the latest Frame it published at up to
+        # _fps - see frames.py. T switches between the pacings.
+        self._render_thread = False
+        self._pacing = WATCH_PACING
+        self._frames = None
 
         self._cars = pygame.sprite.Group()
+        # In evolve mode the cars are simulated together by a Simulation
+        # as a Population, with self._population_cars holding the Car
+        # for each index of it
+        self._simulation = None
+        self._population = None
+        self._population_cars = []
+        # With more than one worker, headless generations are split
+        # across a pool of processes instead
+        self._workers = 1
+        self._evaluator = None
+        # If set, every scored generation is saved here - see snapshot.py
+        self._snapshot_file = None
+        # Headless runs remember the score of every genome they have
+        # simulated, up to this many - see fitness.py. 0 turns it off,
+        # and _reevaluate simulates every car again regardless.
+        self._fitness_cache_size = 100000
+        self._fitness_cache = None
+        self._reevaluate = False
+        # Optional instrumentation - see profiling.py. If _timings_file
+        # is set each generation's per phase timings are written to it,
+        # and if _profile_file is set each generation is run under
+        # cProfile, saved to <_profile_file>.<generation>
+        self._timings_file = None
+        self._timings_format = "jsonl"
+        self._profile_file = None
+        self._timer = None
+        # If set, every car's trajectory is recorded to this file, to
+        # be watched again with replay.py - see recording.py
+        self._recording_file = None
+        self._recorder = None
+        self._snapshot_writer = None
+        self._resumed = False
         self._checkpoints : [Checkpoint] = []
         self._trackname = trackname
         self._tracksg = pygame.sprite.Group()
@@ -35,6 +122,23 @@ class Game:
         self._car_spawn_rotation = None
 
         self._show_checkpoints = False
+        self._sensor = None
+        self._collider = None
+        # The maximum distance, in pixels, that the cars can see
+        self._sensor_range = None
+        # If set, sensing is done with a precomputed table of wall
+        # distances at this angular resolution (in degrees) instead
+        # of casting rays. See Track.sensor_table.
+        self._sensor_resolution = None
+        self._sensor_dtype = "uint16"
+        self._trackfile = None
+        # A compiled track bundle (see bundle.py) for worker processes
+        # to load instead of the track file
+        self._bundle_file = None
+        # Whether worker processes share this process' copy of the
+        # track's arrays instead of loading their own - see shared.py
+        self._share_track = True
+        self._shared_track = None
         self._finishline = None
         self._show_distances = False
         self._show_finishline = False
@@ -42,36 +146,80 @@ class Game:
         self._mode = mode
         self._generation = 1
         self._start_time = None
+        self._tick = 0
+        self._tick_limit = TICK_LIMIT
+        # How many ticks each Simulation step covers, and how many
+        # parts its physics is split into - see Simulation
+        self._timestep = 1
+        self._substeps = 1
+        # Retire cars that stop making progress - see stalling.py.
+        # Both rules are off unless set.
+        self._stall_ticks = None
+        self._stall_window = None
+        self._stall_distance = 20
+
+        # A single seed drives every source of randomness - the initial
+        # networks, mating, car colors and parent selection.
+        self._seed = seed
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+        # Used for breeding, see nn.mate_genomes
+        self._rng = np.random.default_rng(seed)
 
         self._cars_per_generation = cars_per_generation
+        # Cars that didn't make the cut are reused for the next generation
+        self._car_pool = CarPool()
         self._mutation_rate = 0.005
         self._parent_cutoff = 10
+        # How parents are paired up - see selection.SELECTIONS
+        self._selection = "proportional"
 
     def get_time_since_start(self):
+        # Simulated time - this is what the cars are scored on
         if self._start_time is None:
             return None
-        return time.time() - self._start_time
+        return self._tick / TICKS_PER_SECOND
 
     def add_car(self, car : Car):
         self._cars.add(car)
 
     def on_init(self):
-        pygame.init()
+        if self._headless:
+            # Make sure nothing tries to reach for a real display
+            # if some part of pygame initializes the video system
+            os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        else:
+            pygame.init()
         self._track = Track(self._trackname)
         self._tracksg.add(self._track)
-        self._display_surface = pygame.display.set_mode(self._track.get_size())
+        self._collider = FootprintCollider(get_footprint(), self._track.solid)
+        if self._sensor_resolution is None:
+            self._sensor = RaySensor(self._track.occupancy, DISTANCE_ANGLES, max_range=self._sensor_range)
+        else:
+            trackfile = self._trackfile if self._trackfile is not None else self._trackname
+            self._sensor = self._track.sensor_table(trackfile, resolution=self._sensor_resolution, dtype=self._sensor_dtype, angles=DISTANCE_ANGLES, max_range=self._sensor_range)
+        if not self._headless:
+            self._display_surface = pygame.display.set_mode(self._track.get_size())
+            pygame.display.set_caption("Car Game")
         self._running = True
-        pygame.display.set_caption("Car Game")
 
     def on_event(self, event):
         if event.type == pygame.QUIT:
             self._running = False
+        elif event.type == pygame.KEYDOWN and event.key == K_t and self._render_thread:
+            self._pacing = TURBO_PACING if self._pacing == WATCH_PACING else WATCH_PACING
+            print(f"Pacing set to {self._pacing}")
 
     def on_loop(self):
+        if self._population is not None:
+            self.population_loop()
+            return
+
         for car in self._cars:
             if car._crashed:
                 continue
-            for angle in [-60, -30, 0, 30, 60]:
+            for angle in DISTANCE_ANGLES:
                 endpoint, distance = self._track.distance_to_wall(car, angle)
                 car.add_distance(angle, endpoint, distance)
             if self._mode == MANUAL_MODE:
@@ -90,55 +238,187 @@ class Game:
                     car.cross_checkpoint(checkpoint, self.get_time_since_start())
             if self._finishline.check_collision(car):
                 car.cross_finish_line()
-
-    def on_render(self):
-        self._display_surface.fill((69, 68, 67))
-        self._display_surface.blit(self._track.surf, self._track.rect)
-
-        # Car drawing
-        for car in self._cars:
-            car.render()
-            self._display_surface.blit(car.surf, car.rect)
-            
-        # Checkpoints
+        self._tick += 1
+
+    def population_loop(self):
+        active = self._population.active
+        self._simulation.step()
+        self._tick = self._simulation.tick
+
+        # The cars themselves are only needed for drawing (and with a
+        # render thread, that thread syncs them from a Frame instead)
+        if not self._headless and self._frames is None:
+            if self._timer is not None:
+                started = perf_counter()
+            self._population.sync(self._population_cars, active)
+            if self._timer is not None:
+                self._timer.time("sync", started)
+
+    def reset_background(self):
+        self._background = None
+        self._background_key = None
+        self._background_cars = set()
+        self._dirty_rects = []
+
+    # The track, with the checkpoints and finish line if they're shown,
+    # and the crashed cars drawn so far. Made again whenever what's
+    # shown of the checkpoints changes.
+    def update_background(self) -> bool:
+        key = (self._show_checkpoints, len(self._checkpoints), self._finishline is not None)
+        if self._background is not None and key == self._background_key:
+            return False
+        self._background = pygame.Surface(self._display_surface.get_size()).convert()
+        self._background.fill((69, 68, 67))
+        self._background.blit(self._track.surf, self._track.rect)
         if self._show_checkpoints:
             for checkpoint in self._checkpoints:
-                checkpoint.draw(self._display_surface)
+                checkpoint.draw(self._background)
             # Draw the finish line as well
             if self._finishline is not None:
-                self._finishline.draw(self._display_surface)
-        pygame.display.update()
-        self._frame_per_sec.tick(self._fps)
+                self._finishline.draw(self._background)
+        self._background_key = key
+        self._background_cars = set()
+        return True
+
+    # The cars on_render draws - all of them, unless limited to the
+    # ones still alive and/or the _draw_top best scoring so far. The
+    # best are drawn last, so they end up on top.
+    def cars_to_draw(self):
+        cars = self._cars
+        if self._draw_alive_only:
+            cars = [car for car in cars if not car._crashed]
+        if self._draw_top is not None:
+            cars = heapq.nlargest(self._draw_top, cars, key=lambda car : car._score)[::-1]
+        return cars
+
+    # Each line of text in the top left, as (y, text)
+    def hud_lines(self):
+        lines = [
+            (10, f"Generation {self._generation}"),
+            (40, f"The top {self._parent_cutoff} cars will survive and mate"),
+        ]
+        if self._mutation_rate > 0.0:
+            lines.append((70, f"The mutation rate is {round(self._mutation_rate * 100, 2)}%"))
+        if self._frames is not None:
+            lines.append((100, f"{self._pacing.capitalize()} - {self.get_time_since_start():.1f}s simulated"))
+        return lines
+
+    # The rendered text for a line of the HUD - only rendered again
+    # when the line's text changes
+    def hud_text(self, y : int, text : str):
+        cached = self._hud.get(y)
+        if cached is None or cached[0] != text:
+            cached = (text, get_font().render(text, True, (255, 255, 255)))
+            self._hud[y] = cached
+        return cached[1]
+
+    # Only the parts of the window that change are drawn: whatever
+    # was drawn last frame is painted over from the background, the
+    # cars, lines and text are drawn again, and just those areas are
+    # updated. full repaints and updates the whole window instead, for
+    # when something else has drawn on it.
+    def on_render(self, full : bool = False):
+        timer = self._timer
+        if timer is not None:
+            started = perf_counter()
+        if self.update_background() or full:
+            self._display_surface.blit(self._background, (0, 0))
+            dirty = None
+        else:
+            for rect in self._dirty_rects:
+                self._display_surface.blit(self._background, rect, rect)
+            dirty = self._dirty_rects
+        drawn = []
+        if timer is not None:
+            started = timer.time("render.background", started)
+
+        # Car drawing - crashed cars are drawn onto the background
+        # once, and from then on come along with it for free. They go
+        # first, under the cars still moving. With _draw_top, a crashed
+        # car can drop out of the top cars later, so they are drawn
+        # every frame like the moving ones instead.
+        cars = self.cars_to_draw()
+        for car in cars:
+            if not car._crashed:
+                continue
+            if self._draw_top is not None:
+                car.render()
+                drawn.append(self._display_surface.blit(car.surf, car.rect))
+            elif car._id not in self._background_cars:
+                car.render()
+                self._background.blit(car.surf, car.rect)
+                drawn.append(self._display_surface.blit(car.surf, car.rect))
+                self._background_cars.add(car._id)
+        for car in cars:
+            if not car._crashed:
+                car.render()
+                drawn.append(self._display_surface.blit(car.surf, car.rect))
+        if timer is not None:
+            started = timer.time("render.cars", started)
 
         # Distances Drawing
-        if self._show_distances:
+        if self._show_distances and self._frames is not None:
+            frame = self._frames.shown
+            if frame is not None and frame.endpoints is not None:
+                for index in np.flatnonzero(frame.alive):
+                    center = self._population_cars[index].get_center()
+                    for endpoint in frame.endpoints[index]:
+                        drawn.append(pygame.draw.line(self._display_surface, (0, 255, 0), center, endpoint, width=1))
+        elif self._show_distances and self._population is not None:
+            for index in self._population.active:
+                center = self._population_cars[index].get_center()
+                for endpoint in self._population.endpoints[index]:
+                    drawn.append(pygame.draw.line(self._display_surface, (0, 255, 0), center, endpoint, width=1))
+        elif self._show_distances:
             for car in self._cars:
                 for angle in car._distance_endpoints:
-                    pygame.draw.line(self._display_surface, (0, 255, 0), car.get_center(), car._distance_endpoints[angle], width=1)
-
-        # Generation Title
-        generation_title = font.render(f"Generation {self._generation}", True, (255, 255, 255))
-        track_size = self._track.get_size()
-        # self._display_surface.blit(generation_title, (10, track_size[1] - 30))
-        self._display_surface.blit(generation_title, (10, 10))
-
-        # Parent title
-        parent_title = font.render(f"The top {self._parent_cutoff} cars will survive and mate", True, (255, 255, 255))
-        self._display_surface.blit(parent_title, (10, 40))
-
-        # Mutation title
-        if self._mutation_rate > 0.0:
-            mutation_title = font.render(f"The mutation rate is {round(self._mutation_rate * 100, 2)}%", True, (255, 255, 255))
-            self._display_surface.blit(mutation_title, (10, 70))
-
-        pygame.display.update()
+                    drawn.append(pygame.draw.line(self._display_surface, (0, 255, 0), car.get_center(), car._distance_endpoints[angle], width=1))
+
+        # Generation, parent, mutation and pacing titles
+        for y, text in self.hud_lines():
+            drawn.append(self._display_surface.blit(self.hud_text(y, text), (10, y)))
+        if timer is not None:
+            started = timer.time("render.overlays", started)
+
+        if dirty is None:
+            pygame.display.update()
+        else:
+            pygame.display.update(dirty + drawn)
+        self._dirty_rects = drawn
+        if timer is not None:
+            started = timer.time("render.display", started)
+        self._frame_per_sec.tick(self._fps)
+        if timer is not None:
+            timer.time("render.wait", started)
 
     def on_cleanup(self):
         self._start_time = None
+        self.reset_background()
+        self._population = None
+        self._population_cars = []
+
+    def create_simulation(self) -> Simulation:
+        stall_rules = None
+        if self._stall_ticks is not None or self._stall_window is not None:
+            stall_rules = StallRules(self._stall_ticks, self._stall_window, self._stall_distance)
+        simulation = Simulation(
+            self._sensor,
+            self._collider,
+            [(checkpoint._start_at, checkpoint._end_at) for checkpoint in self._checkpoints],
+            (self._finishline._start_at, self._finishline._end_at),
+            self._car_spawn_position,
+            self._car_spawn_rotation,
+            tick_limit=self._tick_limit,
+            stall_rules=stall_rules,
+            timestep=self._timestep,
+            substeps=self._substeps
+        )
+        simulation.timer = self._timer
+        return simulation
 
     def set_car_spawn(self):
         while(self._car_spawn_rotation is None):
-            self.on_render()
+            self.on_render(full=True)
             if self._car_spawn_position is not None:
                 pygame.draw.line(self._display_surface, (255, 0, 0), self._car_spawn_position, pygame.mouse.get_pos(), width=3)
                 pygame.display.update()
@@ -162,7 +442,7 @@ class Game:
 
         while(not pressed_keys[K_RETURN]):
             pressed_keys = pygame.key.get_pressed()
-            self.on_render()
+            self.on_render(full=True)
             for checkpoint in self._checkpoints:
                 checkpoint.draw(self._display_surface)
                 pygame.display.update()
@@ -207,7 +487,7 @@ class Game:
 
         while(self._finishline is None):
             pressed_keys = pygame.key.get_pressed()
-            self.on_render()
+            self.on_render(full=True)
             for checkpoint in self._checkpoints:
                 checkpoint.draw(self._display_surface)
                 pygame.display.update()
@@ -259,112 +539,325 @@ class Game:
             self._cars = pygame.sprite.Group()
 
     def cars_alive(self):
+        if self._population is not None:
+            return self._population.cars_alive()
         count = 0
         for car in self._cars:
             if not car._crashed:
                 count += 1
         return count
 
+    def on_keys(self):
+        # Returns True if the current generation should be stopped early
+        stop = False
+        pressed_keys = pygame.key.get_pressed()
+        if pressed_keys[K_c]:
+            self._show_checkpoints = not self._show_checkpoints
+        if pressed_keys[K_d]:
+            self._show_distances = not self._show_distances
+        if pressed_keys[K_n]:
+            # The N key can accidentally be held down too long skipping
+            # the next generation - annoying. So only pay attention to
+            # the skip key if its been at least 5 seconds.
+            if time.time() - self._start_time > 5:
+                stop = True
+        if pressed_keys[K_MINUS]:
+            self._mutation_rate -= 0.001
+            if self._mutation_rate < 0.0:
+                self._mutation_rate = 0.0
+            print(f"Mutation rate set to {int(self._mutation_rate * 100)}%")
+        if pressed_keys[K_EQUALS]:
+            self._mutation_rate += 0.001
+            if self._mutation_rate > 1.0:
+                self._mutation_rate = 1.0
+            print(f"Mutation rate set to {int(self._mutation_rate * 100)}%")
+        if pressed_keys[K_LEFTBRACKET]:
+            self._parent_cutoff -= 1
+            if self._parent_cutoff <= 2:
+                self._parent_cutoff = 2
+            else:
+                print(f"The top {self._parent_cutoff} cars will be used as parents")
+        if pressed_keys[K_RIGHTBRACKET]:
+            self._parent_cutoff += 1
+            if self._parent_cutoff >= self._cars_per_generation:
+                self._parent_cutoff = self._cars_per_generation - 5
+            else:
+                print(f"The top {self._parent_cutoff} cars will be used as parents")
+        for event in pygame.event.get():
+            self.on_event(event)
+        return stop
+
     def on_execute(self):
         self._start_time = time.time()
-        manual_stop = False
-        while(self._running and self.get_time_since_start() < TIME_LIMIT and self.cars_alive() > 0 and not manual_stop):
-            pressed_keys = pygame.key.get_pressed()
-            if pressed_keys[K_c]:
-                self._show_checkpoints = not self._show_checkpoints
-            if pressed_keys[K_d]:
-                self._show_distances = not self._show_distances
-            if pressed_keys[K_n]:
-                # The N key can accidentally be held down too long skipping
-                # the next generation - annoying. So only pay attention to
-                # the skip key if its been at least 5 seconds.
-                if time.time() - self._start_time > 5:
+        self._tick = 0
+        self.reset_background()
+        if self._mode == EVOLVE_MODE:
+            if self._simulation is None:
+                self._simulation = self.create_simulation()
+            self._population_cars = list(self._cars)
+            self._simulation.start(to_genomes([car._nn for car in self._population_cars]))
+            self._population = self._simulation.population
+            if self._recorder is not None:
+                self._recorder.start(self._generation, [car._color for car in self._population_cars], timestep=self._timestep)
+                self._recorder.record(self._population)
+        if self._render_thread and self._population is not None and not self._headless:
+            self.threaded_loop()
+        else:
+            manual_stop = False
+            while(self._running and self._tick < self._tick_limit and self.cars_alive() > 0 and not manual_stop):
+                if not self._headless and self.on_keys():
                     manual_stop = True
-            if pressed_keys[K_MINUS]:
-                self._mutation_rate -= 0.001
-                if self._mutation_rate < 0.0:
-                    self._mutation_rate = 0.0
-                print(f"Mutation rate set to {int(self._mutation_rate * 100)}%")
-            if pressed_keys[K_EQUALS]:
-                self._mutation_rate += 0.001
-                if self._mutation_rate > 1.0:
-                    self._mutation_rate = 1.0
-                print(f"Mutation rate set to {int(self._mutation_rate * 100)}%")
-            if pressed_keys[K_LEFTBRACKET]:
-                self._parent_cutoff -= 1
-                if self._parent_cutoff <= 2:
-                    self._parent_cutoff = 2
-                else:
-                    print(f"The top {self._parent_cutoff} cars will be used as parents")
-            if pressed_keys[K_RIGHTBRACKET]:
-                self._parent_cutoff += 1
-                if self._parent_cutoff >= self._cars_per_generation:
-                    self._parent_cutoff = self._cars_per_generation - 5
-                else:
-                    print(f"The top {self._parent_cutoff} cars will be used as parents")
-            for event in pygame.event.get():
-                self.on_event(event)
-            self.on_loop()
-            self.on_render()
-        for car in self._cars:
-            car.add_end_score(self.get_time_since_start())
+                self.on_loop()
+                if self._recorder is not None and self._population is not None:
+                    self._recorder.record(self._population)
+                if not self._headless:
+                    self.on_render()
+        if self._population is not None:
+            scores = self._simulation.finish()
+            if self._recorder is not None:
+                self._recorder.finish(scores)
+            self._population.sync(self._population_cars)
+        else:
+            for car in self._cars:
+                car.add_end_score(self.get_time_since_start())
         self.on_cleanup()
 
+    # Run the generation on a thread of its own, drawing the latest
+    # Frame it has published (and handling the keys) here until it is
+    # done - however many ticks it got through in between
+    def threaded_loop(self):
+        self._frames = FrameBuffer(len(self._population))
+        stop = threading.Event()
+        errors = []
+        thread = threading.Thread(target=self.simulation_thread, args=(stop, errors), daemon=True)
+        thread.start()
+        try:
+            while thread.is_alive():
+                if self.on_keys():
+                    stop.set()
+                frame = self._frames.latest()
+                if frame is not None:
+                    if self._timer is not None:
+                        started = perf_counter()
+                    frame.sync(self._population_cars)
+                    if self._timer is not None:
+                        self._timer.time("sync", started)
+                self.on_render()
+        finally:
+            stop.set()
+            thread.join()
+            self._frames = None
+        if errors:
+            raise errors[0]
+
+    def simulation_thread(self, stop : threading.Event, errors : list):
+        try:
+            interval = self._timestep / self._fps
+            deadline = perf_counter()
+            while(self._running and not stop.is_set() and self._tick < self._tick_limit and self.cars_alive() > 0):
+                self.on_loop()
+                if self._recorder is not None:
+                    self._recorder.record(self._population)
+                self._frames.publish(self._population, self._tick, endpoints=self._show_distances)
+                # Watching, keep to a tick per frame (without racing
+                # to catch up if it falls behind)
+                now = perf_counter()
+                if self._pacing == WATCH_PACING and deadline > now:
+                    time.sleep(deadline - now)
+                deadline = max(deadline, now) + interval
+        except Exception as error:
+            errors.append(error)
+
+    # Score the current generation, either by running it here or
+    # (in headless mode) by handing it to the worker processes. In
+    # headless mode, genomes that have been scored before aren't
+    # simulated again. While recording every car has to be simulated
+    # here, so that every car's trajectory can be recorded.
+    def evaluate_generation(self):
+        if self._recorder is not None or (self._evaluator is None and self._fitness_cache is None):
+            self.on_execute()
+            return
+        cars = list(self._cars)
+        genomes = to_genomes([car._nn for car in cars])
+        if self._fitness_cache is None:
+            scores = self.score_genomes(genomes)
+        else:
+            scores = self._fitness_cache.evaluate(genomes, self.score_genomes, force=self._reevaluate)
+        for car, score in zip(cars, scores):
+            car._score = int(score)
+
+    # evaluate_generation, with whatever instrumentation is turned on
+    def timed_evaluate_generation(self):
+        if self._timer is not None:
+            self._timer.reset()
+
+        started = perf_counter()
+        if self._profile_file is not None:
+            profile(self.evaluate_generation, f"{self._profile_file}.{self._generation}")
+        else:
+            self.evaluate_generation()
+
+        # Unless the run was stopped part way through the generation
+        if self._timer is not None and self._running:
+            record = self._timer.summary(self._generation, perf_counter() - started)
+            TimingExporter(self._timings_file, self._timings_format).export(record)
+
+    def score_genomes(self, genomes):
+        if self._evaluator is not None:
+            return self._evaluator.evaluate(genomes, self._timer)
+        if self._simulation is None:
+            self._simulation = self.create_simulation()
+        return self._simulation.run(genomes)
+
+    # Everything besides a car's genome that its score depends on
+    def fitness_config(self) -> bytes:
+        with open(self._trackfile, 'rb') as readfile:
+            trackfile = readfile.read()
+        return config_digest(trackfile, self._track.image_hash(), self.simulation_options())
+
+    # What worker processes should load the track from - see
+    # bundle.load_simulation. A shared track is published from the
+    # bundle file if there is one, otherwise from this Game's track.
+    def worker_track(self):
+        if self._share_track:
+            if self._shared_track is None:
+                bundle = load_bundle(self._bundle_file) if self._bundle_file is not None else bundle_from_game(self)
+                self._shared_track = publish_track(bundle, free_index=self._sensor_resolution is not None)
+            return self._shared_track.descriptor()
+        if self._bundle_file is not None:
+            return self._bundle_file
+        return self._trackfile
+
+    # The settings a worker process needs to simulate the same way
+    def simulation_options(self):
+        return {
+            "_sensor_range": self._sensor_range,
+            "_sensor_resolution": self._sensor_resolution,
+            "_sensor_dtype": self._sensor_dtype,
+            "_tick_limit": self._tick_limit,
+            "_stall_ticks": self._stall_ticks,
+            "_stall_window": self._stall_window,
+            "_stall_distance": self._stall_distance,
+            "_timestep": self._timestep,
+            "_substeps": self._substeps,
+        }
+
     def manual_play(self):
+        if self._headless:
+            raise ValueError("Manual play requires a display")
         self._mode = MANUAL_MODE
         self.on_execute()
 
+    # The state of every random number generator, in a form that can
+    # be saved as JSON
+    def rng_state(self) -> dict:
+        numpy_state = np.random.get_state(legacy=False)
+        numpy_state["state"]["key"] = numpy_state["state"]["key"].tolist()
+        return {
+            "random": random.getstate(),
+            "numpy": numpy_state,
+            "rng": self._rng.bit_generator.state,
+        }
+
+    def set_rng_state(self, state : dict):
+        version, internal_state, gauss_next = state["random"]
+        random.setstate((version, tuple(internal_state), gauss_next))
+        numpy_state = state["numpy"]
+        numpy_state["state"]["key"] = np.array(numpy_state["state"]["key"], dtype=np.uint32)
+        np.random.set_state(numpy_state)
+        self._rng.bit_generator.state = state["rng"]
+
+    # Save the scored generation (best first), without holding up
+    # the next one
+    def snapshot(self, cars : [Car]):
+        if self._snapshot_file is None:
+            return
+        if self._snapshot_writer is None:
+            self._snapshot_writer = SnapshotWriter(self._snapshot_file)
+        self._snapshot_writer.write(Snapshot(
+            to_genomes([car._nn for car in cars]).astype(np.float32),
+            np.array([car._score for car in cars], dtype=np.int64),
+            self._generation,
+            self._mutation_rate,
+            self._parent_cutoff,
+            self.rng_state()
+        ))
+
+    # Pick an evolution run back up from a snapshot. The saved
+    # generation is already scored, so evolve goes straight on to
+    # breeding the next one. Its weights come back float32 rounded -
+    # see snapshot.py.
+    def resume(self, filepath : str):
+        snapshot = load_snapshot(filepath)
+        self._cars = pygame.sprite.Group()
+        for genome, score in zip(snapshot.genomes, snapshot.scores):
+            car = Car(self._car_spawn_position, self._car_spawn_rotation, nn=from_genome(genome))
+            car._score = int(score)
+            self.add_car(car)
+
+        self._cars_per_generation = len(snapshot)
+        self._generation = snapshot.generation
+        self._mutation_rate = snapshot.mutation_rate
+        self._parent_cutoff = snapshot.parent_cutoff
+        if snapshot.rng_state is not None:
+            self.set_rng_state(snapshot.rng_state)
+        self._resumed = True
+
     def evolve(self):
         self._mode = EVOLVE_MODE
         # init our first generation
-        for i in range(0, self._cars_per_generation):
-            self.add_car(Car(self._car_spawn_position, self._car_spawn_rotation))
+        if not self._resumed:
+            for i in range(0, self._cars_per_generation):
+                self.add_car(Car(self._car_spawn_position, self._car_spawn_rotation))
+
+        if self._workers > 1 and self._headless:
+            self._evaluator = ParallelEvaluator(self.worker_track(), self._workers, self.simulation_options(), timed=self._timings_file is not None)
+        if self._headless and self._fitness_cache_size > 0 and self._trackfile is not None:
+            self._fitness_cache = FitnessCache(self.fitness_config(), self._fitness_cache_size)
+        if self._timings_file is not None:
+            self._timer = PhaseTimer()
+        if self._recording_file is not None:
+            self._recorder = TrajectoryRecorder(self._recording_file, self._trackfile)
 
         while(self._running):
             print(f"===== GENERATION {self._generation} =====")    
-            self.on_execute()
+            if self._resumed:
+                self._resumed = False
+            else:
+                self.timed_evaluate_generation()
             
             # Now that execute is over, let's order the cars by their scores.
             cars = sorted(self._cars, key=lambda car : car._score, reverse=True)
+            # Unless the run was stopped part way through the generation
+            if self._running:
+                self.snapshot(cars)
             self._cars = cars[0:self._parent_cutoff]
-            self.on_render()
-            time.sleep(3)
+            if not self._headless:
+                self.on_render()
+                # Pause on the results, unless in a hurry
+                if not (self._render_thread and self._pacing == TURBO_PACING):
+                    time.sleep(3)
+
+            for car in cars[self._parent_cutoff:]:
+                self._car_pool.release(car)
 
             next_generation = cars[0:self._parent_cutoff]
-            parents = cars[0:self._parent_cutoff] # This is duplicated solely for the mate_counter
             scores = [car._score for car in next_generation]
             print("SCORES", [car._score for car in next_generation])
-            # random.choices does *not* work with negative weights. It also fails if
-            # all weights are zreo. offset the scores such that the lowest possible
-            # weight + 1 is the minimum value.
-            offset = abs(min(scores))
-            scores = [score + offset + 1 for score in scores]
-
-            mate_counter = {}
-            while len(next_generation) < self._cars_per_generation:
-                # The probability of each car being chosen is based on their total scores
-                car_a = choices(cars[0:self._parent_cutoff], weights=scores)[0]
-                car_b = None
-                while car_b is None or car_a == car_b: # we want to prevent a self mate - outside of mutation it would result in no difference, plus the car could go blind
-                    car_b = choices(cars[0:self._parent_cutoff], weights=scores)[0]
-                
-                # Update the mate counter
-                car_a_parent_index = parents.index(car_a)
-                car_b_parent_index = parents.index(car_b)
-                if car_a_parent_index not in mate_counter:
-                    mate_counter[car_a_parent_index] = 0
-                mate_counter[car_a_parent_index] += 1
-                if car_b_parent_index not in mate_counter:
-                    mate_counter[car_b_parent_index] = 0
-                mate_counter[car_b_parent_index] += 1
-
-                # Create the new car
-                new_car  = car_mate(car_a, car_b, mutation=self._mutation_rate)
-                next_generation.append(new_car)
+            # How many cars so far were scored from the fitness cache
+            # rather than simulated
+            cache = self._fitness_cache
+            if cache is not None and cache.hits + cache.misses > 0:
+                print(f"Fitness cache hits {cache.hits} of {cache.hits + cache.misses} ({cache.hits / (cache.hits + cache.misses):.0%})")
+
+            # Fill out the rest of the generation with the parents' children
+            children, mate_counter = breed([car._nn for car in next_generation], scores, self._cars_per_generation - len(next_generation), self._mutation_rate, rng=self._rng, selection=self._selection)
+            for nn in children:
+                next_generation.append(self._car_pool.get(self._car_spawn_position, self._car_spawn_rotation, nn=nn))
 
             # Print the mate counter:
             print("Mate Counter")
-            pprint(mate_counter)
+            pprint({parent: int(count) for parent, count in enumerate(mate_counter) if count > 0})
 
             # Reset each parent that made it to the next generation
             for car in next_generation:
@@ -382,6 +875,19 @@ class Game:
                 self.add_car(car)
             self._generation += 1
 
+        if self._evaluator is not None:
+            self._evaluator.close()
+            self._evaluator = None
+        if self._shared_track is not None:
+            self._shared_track.close()
+            self._shared_track = None
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = None
+        if self._snapshot_writer is not None:
+            self._snapshot_writer.close()
+            self._snapshot_writer = None
+
     def init(self):
         if self.on_init() == False:
             self._running = False
@@ -408,15 +914,26 @@ class Game:
             json.dump(settings, writefile)
     
 
-def load_from_file(filepath : str) -> Game:
+def load_from_file(filepath : str, headless : bool = False, seed : int = None) -> Game:
     with open(filepath, 'r') as readfile:
         settings = json.load(readfile)
 
-        game = Game(settings['trackname'], mode=settings['mode'], cars_per_generation=settings['cars_per_generation'])
+        game = Game(settings['trackname'], mode=settings['mode'], cars_per_generation=settings['cars_per_generation'], headless=headless, seed=seed)
         for checkpoint in settings['checkpoints']:
             game._checkpoints.append(Checkpoint((checkpoint[0], checkpoint[1]), (checkpoint[2], checkpoint[3])))
         game._finishline = FinishLine((settings["finish_line"][0], settings["finish_line"][1]), (settings["finish_line"][2], settings["finish_line"][3]))
         game._car_spawn_position = settings['car_start_pos']
         game._car_spawn_rotation = settings['car_start_rot']
+        game._trackfile = filepath
+
+        return game
+
 
-        return game
\ No newline at end of file
+# Load a track file straight into a headless Simulation. options are
+# Game attributes to set first - see Game.simulation_options.
+def load_simulation(filepath : str, options : dict = {}) -> Simulation:
+    game = load_from_file(filepath, headless=True)
+    for name, value in options.items():
+        setattr(game, name, value)
+    game.init()
+    return game.create_simulation()
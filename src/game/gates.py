@@ -0,0 +1,117 @@
+import numpy as np
+
+# How big, in pixels, each cell of a GateIndex's grid is
+CELL_SIZE = 64
+
+# The GateIndex finds which gates - the checkpoints, and the finish
+# line - the cars in a population crossed as they moved. Only the
+# segment each car moved along is tested, so cars can't skip over a
+# gate no matter how fast they go, and only against the gates in the
+# grid cells that segment passes over, so the cost doesn't grow with
+# the number of checkpoints. Like Car.cross_checkpoint, checkpoints
+# can be crossed in any order - which of them a car has already
+# scored is kept by the Population, not here.
+#
+# checkpoints is a list of ((x, y), (x, y)) segments, and finishline
+# a single segment.
+class GateIndex():
+
+    def __init__(self, checkpoints, finishline, cell : int = CELL_SIZE):
+        gates = list(checkpoints) + [finishline]
+        self._finishline = len(checkpoints)
+        self._starts = np.array([gate[0] for gate in gates], dtype=np.float64).reshape(-1, 2)
+        self._ends = np.array([gate[1] for gate in gates], dtype=np.float64).reshape(-1, 2)
+        self._cell = cell
+
+        # Every gate is listed in each cell its bounding box covers
+        low = np.floor(np.minimum(self._starts, self._ends) / cell).astype(np.int64)
+        high = np.floor(np.maximum(self._starts, self._ends) / cell).astype(np.int64)
+        self._origin = low.min(axis=0)
+        shape = high.max(axis=0) - self._origin + 1
+        cells = {}
+        for gate in range(len(gates)):
+            for x in range(low[gate, 0], high[gate, 0] + 1):
+                for y in range(low[gate, 1], high[gate, 1] + 1):
+                    cells.setdefault((x - self._origin[0], y - self._origin[1]), []).append(gate)
+        depth = max(len(listed) for listed in cells.values())
+        self._grid = np.full((shape[0], shape[1], depth), -1, dtype=np.int64)
+        for (x, y), listed in cells.items():
+            self._grid[x, y, :len(listed)] = listed
+
+    # Given the indexes of the cars that moved and where they moved
+    # from and to, returns the indexes of the cars that crossed a
+    # checkpoint and which checkpoint (a car can cross several), whether
+    # each of those was crossed after the car crossed the finish line
+    # on the same move, and the indexes of the cars that crossed the
+    # finish line.
+    def crossings(self, indexes, previous, current):
+        indexes = np.asarray(indexes)
+        previous = np.asarray(previous, dtype=np.float64)
+        current = np.asarray(current, dtype=np.float64)
+
+        # The cells under each move's bounding box, clipped to the grid
+        low = np.floor(np.minimum(previous, current) / self._cell).astype(np.int64) - self._origin
+        high = np.floor(np.maximum(previous, current) / self._cell).astype(np.int64) - self._origin
+        low = np.maximum(low, 0)
+        high = np.minimum(high, np.array(self._grid.shape[:2]) - 1)
+        span = high - low
+
+        rows = []
+        gates = []
+        if len(indexes) > 0 and (span >= 0).all(axis=1).any():
+            for x in range(span[:, 0].max() + 1):
+                for y in range(span[:, 1].max() + 1):
+                    covers = np.flatnonzero((span[:, 0] >= x) & (span[:, 1] >= y))
+                    listed = self._grid[low[covers, 0] + x, low[covers, 1] + y]
+                    row, column = np.nonzero(listed >= 0)
+                    rows.append(covers[row])
+                    gates.append(listed[row, column])
+        if len(rows) > 0:
+            rows = np.concatenate(rows)
+            gates = np.concatenate(gates)
+        else:
+            rows = np.zeros(0, dtype=np.int64)
+            gates = np.zeros(0, dtype=np.int64)
+
+        # A gate over more than one of a move's cells is only tested once
+        pairs = np.unique(rows * len(self._starts) + gates)
+        rows = pairs // len(self._starts)
+        gates = pairs % len(self._starts)
+
+        crossed = segments_intersect(previous[rows], current[rows], self._starts[gates], self._ends[gates])
+        rows = rows[crossed]
+        gates = gates[crossed]
+
+        # How far along its move each car crossed each gate, to tell
+        # the checkpoints crossed before the finish line from those after
+        along = crossing_fraction(previous[rows], current[rows], self._starts[gates], self._ends[gates])
+        finish = gates == self._finishline
+        finished_at = np.full(len(previous), np.inf)
+        finished_at[rows[finish]] = along[finish]
+        after = along[~finish] > finished_at[rows[~finish]]
+
+        return indexes[rows[~finish]], gates[~finish], after, indexes[rows[finish]]
+
+def cross(a, b):
+    return a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0]
+
+# Whether each segment a0->a1 intersects the matching segment b0->b1.
+# All arguments are (n, 2) arrays.
+def segments_intersect(a0, a1, b0, b1):
+    a = a1 - a0
+    b = b1 - b0
+    side_0 = cross(b, a0 - b0)
+    side_1 = cross(b, a1 - b0)
+    side_2 = cross(a, b0 - a0)
+    side_3 = cross(a, b1 - a0)
+    moved = (a[:, 0] != 0) | (a[:, 1] != 0)
+    return moved & (side_0 * side_1 <= 0) & (side_2 * side_3 <= 0)
+
+# How far along each segment a0->a1 (from 0 to 1) it meets the line
+# through the matching b0->b1 - 0 for segments that run along it
+def crossing_fraction(a0, a1, b0, b1):
+    a = a1 - a0
+    b = b1 - b0
+    denominator = cross(a, b)
+    parallel = denominator == 0
+    return np.where(parallel, 0.0, cross(b0 - a0, b) / np.where(parallel, 1.0, denominator))
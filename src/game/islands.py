@@ -0,0 +1,213 @@
+import io
+import queue
+import random
+import socket
+import struct
+import threading
+from multiprocessing import Process, Queue
+
+import numpy as np
+
+from .evolution import breed
+from .bundle import load_simulation
+from .nn import NN, to_genomes, from_genome
+
+# The island model runs several independent populations ("islands"),
+# each evolving just like Game.evolve does. Every few generations
+# each island sends copies of its best genomes to the next island in
+# a ring, where they replace that island's weakest children. Islands
+# never wait on one another - migrants are picked up whenever they
+# have arrived - so adding islands adds throughput, and the mostly
+# separate populations keep more variety than one big population.
+#
+# How migrants travel is up to the transport. A transport has send,
+# which takes a (migrants, GENOME_SIZE) genome matrix, and receive,
+# which returns a list of every genome matrix that has arrived since
+# it was last called.
+
+# A transport for islands in processes on this machine
+class QueueTransport():
+
+    def __init__(self, inbox : Queue, outbox : Queue):
+        self._inbox = inbox
+        self._outbox = outbox
+
+    def send(self, genomes):
+        self._outbox.put(np.asarray(genomes))
+
+    def receive(self):
+        arrived = []
+        while True:
+            try:
+                arrived.append(self._inbox.get_nowait())
+            except queue.Empty:
+                return arrived
+
+    def close(self):
+        pass
+
+# A transport for islands on different hosts. Each island listens on
+# an address for migrants and sends its own to the next island's.
+# Both can be on localhost, ie --listen localhost:5000 --peer
+# localhost:5001 and the reverse in a second terminal.
+# If the peer can't be reached (yet) its migrants are simply dropped.
+class SocketTransport():
+
+    def __init__(self, listen : (str, int), peer : (str, int)):
+        self._peer = peer
+        self._connection = None
+        self._inbox = queue.Queue()
+
+        self._server = socket.create_server(listen)
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._read, args=(connection,), daemon=True).start()
+
+    def _read(self, connection):
+        with connection:
+            while True:
+                header = read_exactly(connection, 8)
+                if header is None:
+                    return
+                (length,) = struct.unpack("!Q", header)
+                payload = read_exactly(connection, length)
+                if payload is None:
+                    return
+                self._inbox.put(np.load(io.BytesIO(payload), allow_pickle=False))
+
+    def send(self, genomes):
+        buffer = io.BytesIO()
+        np.save(buffer, np.asarray(genomes), allow_pickle=False)
+        payload = buffer.getvalue()
+        try:
+            if self._connection is None:
+                self._connection = socket.create_connection(self._peer, timeout=5)
+            self._connection.sendall(struct.pack("!Q", len(payload)) + payload)
+        except OSError:
+            self._connection = None
+
+    def receive(self):
+        arrived = []
+        while True:
+            try:
+                arrived.append(self._inbox.get_nowait())
+            except queue.Empty:
+                return arrived
+
+    def close(self):
+        self._server.close()
+        if self._connection is not None:
+            self._connection.close()
+
+def read_exactly(connection, length : int):
+    data = b""
+    while len(data) < length:
+        chunk = connection.recv(length - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+# "host:port" to ("host", port)
+def parse_address(address : str) -> (str, int):
+    host, port = address.rsplit(":", 1)
+    return (host, int(port))
+
+# A single population evolving on its own Simulation
+class Island():
+
+    def __init__(self, simulation, size : int, parent_cutoff : int = 10, mutation_rate : float = 0.005, name : str = "Island", rng : np.random.Generator = None, selection : str = "proportional"):
+        self._simulation = simulation
+        self._selection = selection
+        self._rng = rng if rng is not None else np.random.default_rng()
+        self._size = size
+        self._parent_cutoff = parent_cutoff
+        self._mutation_rate = mutation_rate
+        self._name = name
+        self._generation = 1
+        # Always kept best first after the first generation
+        self._nns = [NN() for _ in range(size)]
+
+    def evolve_generation(self):
+        scores = self._simulation.run(to_genomes(self._nns))
+        # Stable, like sorting the cars in Game.evolve
+        order = np.argsort(-scores, kind='stable')
+        parents = [self._nns[index] for index in order[:self._parent_cutoff]]
+        parent_scores = [int(scores[index]) for index in order[:self._parent_cutoff]]
+        print(f"{self._name} - generation {self._generation} - SCORES {parent_scores}", flush=True)
+
+        children, _ = breed(parents, parent_scores, self._size - len(parents), self._mutation_rate, rng=self._rng, selection=self._selection)
+        self._nns = parents + children
+        self._generation += 1
+
+    def emigrants(self, count : int):
+        return to_genomes(self._nns[:count])
+
+    # Migrants take the place of the newest children
+    def immigrate(self, genomes):
+        genomes = np.asarray(genomes)
+        count = min(len(genomes), self._size - self._parent_cutoff)
+        for offset in range(count):
+            self._nns[self._size - 1 - offset] = from_genome(genomes[offset])
+
+def run_island(
+    trackfile : str,
+    transport,
+    options : dict = {},
+    size : int = 50,
+    parent_cutoff : int = 10,
+    mutation_rate : float = 0.005,
+    selection : str = "proportional",
+    migrate_every : int = 5,
+    migrants : int = 2,
+    seed : int = None,
+    name : str = "Island",
+    generations : int = None
+    ):
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+
+    island = Island(
+        load_simulation(trackfile, options),
+        size,
+        parent_cutoff=parent_cutoff,
+        mutation_rate=mutation_rate,
+        name=name,
+        rng=np.random.default_rng(seed),
+        selection=selection
+    )
+    try:
+        generation = 0
+        while generations is None or generation < generations:
+            island.evolve_generation()
+            generation += 1
+            if generation % migrate_every == 0:
+                transport.send(island.emigrants(migrants))
+            for genomes in transport.receive():
+                island.immigrate(genomes)
+    finally:
+        transport.close()
+
+# Run count islands as processes on this machine, in a ring
+def run_islands(trackfile : str, count : int, seed : int = None, **kwargs):
+    queues = [Queue() for _ in range(count)]
+    processes = []
+    for index in range(count):
+        transport = QueueTransport(queues[index], queues[(index + 1) % count])
+        process = Process(
+            target=run_island,
+            args=(trackfile, transport),
+            kwargs=dict(kwargs, seed=None if seed is None else seed + index, name=f"Island {index + 1}")
+        )
+        process.start()
+        processes.append(process)
+
+    for process in processes:
+        process.join()
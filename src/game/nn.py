@@ -2,6 +2,8 @@ import numpy as np
 from random import uniform
 
 HIDDEN_LAYER_SIZE = 10
+INPUT_SIZE = 7
+OUTPUT_SIZE = 6
 
 class NN():
 
@@ -19,8 +21,8 @@ class NN():
         # 5+6. turn right (soft and hard)
 
         # hidden layer size
-        input_size = 7
-        output_size = 6
+        input_size = INPUT_SIZE
+        output_size = OUTPUT_SIZE
 
         # The amount of layers inbetween can vary, but for
         # now we'll do just one.
@@ -42,6 +44,112 @@ class NN():
 
         return output
 
+# PopulationNN runs the networks of an entire population at once.
+# The weights of every network are stacked into contiguous
+# (pop, 7, 10) and (pop, 10, 6) tensors so that a (pop, 7) input
+# matrix becomes a (pop, 6) output matrix with one batched matmul
+# per layer. The intermediate buffers are allocated once and reused
+# every step.
+class PopulationNN():
+
+    # genomes is a (pop, GENOME_SIZE) matrix - see to_genomes
+    def __init__(self, genomes):
+        self._all_weights = split_genomes(genomes)
+        size = len(genomes)
+        self.weights = self._all_weights
+        self._selected = None
+
+        self._input = np.empty((size, 1, INPUT_SIZE))
+        self._hidden = np.empty((size, 1, HIDDEN_LAYER_SIZE))
+        self._output = np.empty((size, 1, OUTPUT_SIZE))
+
+    def __len__(self):
+        return len(self._all_weights[0])
+
+    # Limit inference to the networks at the given indexes (ie the
+    # cars that are still driving). The weights are only gathered
+    # again when the selection actually changes.
+    def select(self, indexes):
+        if indexes is self._selected:
+            return
+        self._selected = indexes
+        if len(indexes) == len(self):
+            self.weights = self._all_weights
+        else:
+            self.weights = [weight[indexes] for weight in self._all_weights]
+
+    # inputs is a (n, 7) matrix of speed, rotation, and the 5 distances
+    # for each selected network. The returned (n, 6) matrix is a view
+    # into a reused buffer and is only valid until the next call.
+    def infer(self, inputs, indexes=None):
+        if indexes is not None:
+            self.select(indexes)
+        count = len(inputs)
+        input = self._input[:count]
+        hidden = self._hidden[:count]
+        output = self._output[:count]
+
+        input[:, 0, :] = inputs
+        np.matmul(input, self.weights[0], out=hidden)
+        np.maximum(hidden, 0, out=hidden)
+        np.matmul(hidden, self.weights[1], out=output)
+
+        # sigmoid, in place
+        np.negative(output, out=output)
+        with np.errstate(over='ignore'):
+            np.exp(output, out=output)
+        output += 1
+        np.reciprocal(output, out=output)
+
+        return output[:, 0, :]
+
+# A genome is every weight of a NN flattened into a single row, so a
+# whole population can be passed around as one compact matrix.
+GENOME_SIZE = INPUT_SIZE * HIDDEN_LAYER_SIZE + HIDDEN_LAYER_SIZE * OUTPUT_SIZE
+
+def to_genomes(nns : [NN]):
+    genomes = np.empty((len(nns), GENOME_SIZE), dtype=np.float64)
+    for row, nn in enumerate(nns):
+        genomes[row, :INPUT_SIZE * HIDDEN_LAYER_SIZE] = np.ravel(nn.weights[0])
+        genomes[row, INPUT_SIZE * HIDDEN_LAYER_SIZE:] = np.ravel(nn.weights[1])
+    return genomes
+
+# Split a (pop, GENOME_SIZE) matrix of genomes into contiguous
+# (pop, 7, 10) and (pop, 10, 6) weight tensors
+def split_genomes(genomes):
+    genomes = np.asarray(genomes, dtype=np.float64).reshape(-1, GENOME_SIZE)
+    size = len(genomes)
+    return [
+        np.ascontiguousarray(genomes[:, :INPUT_SIZE * HIDDEN_LAYER_SIZE].reshape(size, INPUT_SIZE, HIDDEN_LAYER_SIZE)),
+        np.ascontiguousarray(genomes[:, INPUT_SIZE * HIDDEN_LAYER_SIZE:].reshape(size, HIDDEN_LAYER_SIZE, OUTPUT_SIZE)),
+    ]
+
+def from_genome(genome) -> NN:
+    weights = split_genomes(genome)
+    return NN(weights=[weights[0][0], weights[1][0]])
+
+# mate for a whole batch of children at once. parents is a
+# (n, GENOME_SIZE) matrix of parent genomes, and a and b are arrays
+# of the parent indexes (rows) to mate for each child. Returns a
+# (len(a), GENOME_SIZE) matrix of children genomes.
+#
+# Every weight has the same odds as in mate - replaced by a random
+# value with probability mutation, otherwise taken from parent a with
+# probability a_parentage, otherwise from parent b.
+def mate_genomes(parents, a, b, a_parentage : float = 0.5, mutation : float = 0.05, rng : np.random.Generator = None):
+    if rng is None:
+        rng = np.random.default_rng()
+    parents = np.asarray(parents, dtype=np.float64).reshape(-1, GENOME_SIZE)
+    shape = (len(a), GENOME_SIZE)
+
+    from_a = rng.random(shape) < a_parentage
+    children = np.where(from_a, parents[a], parents[b])
+
+    mutated = rng.random(shape) < mutation
+    children[mutated] = rng.uniform(-1, 1, size=np.count_nonzero(mutated))
+
+    return children
+
 # standard sigmoid activation function
 def sigmoid(input):
     return 1/(1+np.exp(-input))
@@ -0,0 +1,63 @@
+import multiprocessing
+import numpy as np
+
+from .bundle import load_simulation
+from .profiling import PhaseTimer
+
+# Each worker process holds its own Simulation of the track
+_simulation = None
+
+def _init_worker(trackfile, options : dict, timed : bool):
+    global _simulation
+    _simulation = load_simulation(trackfile, options)
+    if timed:
+        _simulation.timer = PhaseTimer()
+
+# Returns the scores, and the worker's PhaseTimer for just these cars
+# (None if it isn't timed)
+def _evaluate(genomes):
+    timer = _simulation.timer
+    if timer is not None:
+        timer.reset()
+    return _simulation.run(genomes), timer
+
+# A ParallelEvaluator scores a generation by splitting it across a
+# pool of worker processes. Each worker loads the same track - from a
+# track file, a compiled track bundle, or best of all a track shared
+# in memory (see shared.py) - and runs a headless Simulation of its
+# share of the cars. Only the
+# genomes go to the workers and only the scores come back.
+#
+# Cars never interact with one another and the simulation itself
+# has no randomness, so the scores are identical to evaluating the
+# whole generation in one process.
+class ParallelEvaluator():
+
+    # trackfile is anything bundle.load_simulation takes. options are
+    # Game attributes to set in each worker before it loads the
+    # track, ie {"_sensor_range": 200}. If timed, the workers time
+    # every phase of their simulations, see evaluate.
+    def __init__(self, trackfile, workers : int, options : dict = {}, timed : bool = False):
+        self._workers = workers
+        self._pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(trackfile, options, timed))
+
+    # Returns the score for each row of the (pop, GENOME_SIZE) genomes.
+    # If the workers are timed and a timer (a profiling.PhaseTimer) is
+    # given, their timings are added to it.
+    def evaluate(self, genomes, timer : PhaseTimer = None):
+        genomes = np.asarray(genomes)
+        # Deal the cars out like cards so every worker gets a similar
+        # mix of strong and weak cars
+        slices = [genomes[start::self._workers] for start in range(self._workers)]
+        results = self._pool.map(_evaluate, slices)
+
+        scores = np.zeros(len(genomes), dtype=np.int64)
+        for start, (result, worker_timer) in enumerate(results):
+            scores[start::self._workers] = result
+            if timer is not None and worker_timer is not None:
+                timer.merge(worker_timer)
+        return scores
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
@@ -0,0 +1,136 @@
+import numpy as np
+
+from .scoring import CRASH, CHECKPOINT, NO_CHECKPOINTS, STALL
+
+MAX_SPEED = 10
+COAST_DEACCELERATION = 0.05
+
+# A Population holds the state of every car in a generation as
+# flat numpy arrays (a "structure of arrays") so that the physics
+# for the whole generation can be stepped in one call instead of
+# walking each Car sprite in python.
+#
+# Crashed cars never move again, so we keep a compacted array of
+# the indexes of the cars still driving in self.active. Every
+# per-step operation only touches those cars.
+class Population():
+
+    def __init__(self, positions, rotations, checkpoints : int = 0, distances : int = 5):
+        self._size = len(positions)
+
+        self.positions = np.array(positions, dtype=np.float64).reshape(self._size, 2)
+        self.rotations = np.array(rotations, dtype=np.float64).reshape(self._size)
+        self.speeds = np.zeros(self._size, dtype=np.float64)
+        self.alive = np.ones(self._size, dtype=bool)
+        self.scores = np.zeros(self._size, dtype=np.int64)
+
+        # The wall distances last measured by each car, and the
+        # points they were measured to - see sensing.DISTANCE_ANGLES
+        # for the angle of each column
+        self.distances = np.zeros((self._size, distances), dtype=np.float64)
+        self.endpoints = np.zeros((self._size, distances, 2), dtype=np.int64)
+
+        # Which checkpoints each car has crossed, and whether or not
+        # they have crossed the finish line (which clears the former)
+        self.checkpoints = np.zeros((self._size, checkpoints), dtype=bool)
+        self.finished = np.zeros(self._size, dtype=bool)
+
+        self.active = np.arange(self._size)
+
+    def __len__(self):
+        return self._size
+
+    def cars_alive(self):
+        return len(self.active)
+
+    # The (active, 7) NN input matrix for the active cars: speed,
+    # rotation, then each of the measured distances
+    def nn_inputs(self):
+        active = self.active
+        return np.column_stack((self.speeds[active], self.rotations[active], self.distances[active]))
+
+    # Apply Car.move to every active car at once. accelerations
+    # and rotations are aligned with self.active. dt is how many
+    # ticks the move covers - Car.move is always one.
+    def move(self, accelerations, rotations, dt : float = 1.0):
+        active = self.active
+        accelerations = np.asarray(accelerations, dtype=np.float64)
+
+        rotation = self.rotations[active] + rotations * dt
+        self.rotations[active] = rotation
+
+        # Cars that are not accelerating coast to a stop
+        speed = self.speeds[active]
+        accelerations = np.where(accelerations == 0, -np.minimum(speed, COAST_DEACCELERATION * dt), accelerations * dt)
+
+        velocity = np.minimum(speed + accelerations, MAX_SPEED)
+
+        # This is vector(velocity, 0).rotate(-rotation), dt times over
+        radians = np.radians(rotation)
+        self.positions[active, 0] += velocity * dt * np.cos(radians)
+        self.positions[active, 1] -= velocity * dt * np.sin(radians)
+        self.speeds[active] = np.abs(velocity)
+
+    def crash(self, indexes, seconds_since_start : int):
+        self._retire(indexes, CRASH + int(seconds_since_start))
+
+    # Stalled cars are taken off the track like crashed ones, but
+    # don't get credit for the time they spent not going anywhere
+    def stall(self, indexes):
+        self._retire(indexes, STALL)
+
+    def _retire(self, indexes, score : int):
+        indexes = np.asarray(indexes, dtype=np.intp)
+        indexes = indexes[self.alive[indexes]]
+        if len(indexes) == 0:
+            return
+        self.scores[indexes] += score
+        self.alive[indexes] = False
+        self.active = self.active[self.alive[self.active]]
+
+    # checkpoint is either a single checkpoint index for all of the
+    # cars, or an array of checkpoint indexes matching indexes - a car
+    # can cross more than one at once. Like Car.cross_checkpoint, only
+    # checkpoints a car hasn't crossed yet score. Returns the indexes
+    # of the cars that scored.
+    def cross_checkpoint(self, indexes, checkpoint, seconds_since_start : int):
+        indexes = np.asarray(indexes, dtype=np.intp)
+        checkpoint = np.broadcast_to(np.asarray(checkpoint, dtype=np.intp), indexes.shape)
+        new = ~self.checkpoints[indexes, checkpoint]
+        indexes = indexes[new]
+        checkpoint = checkpoint[new]
+        np.add.at(self.scores, indexes, CHECKPOINT - int(seconds_since_start))
+        self.checkpoints[indexes, checkpoint] = True
+        return indexes
+
+    def cross_finish_line(self, indexes):
+        indexes = np.asarray(indexes, dtype=np.intp)
+        self.checkpoints[indexes] = False
+        self.finished[indexes] = True
+
+    def add_end_score(self):
+        no_checkpoints = ~(self.checkpoints.any(axis=1) | self.finished)
+        self.scores[no_checkpoints] += NO_CHECKPOINTS
+
+    # Copy the state of the given cars (by default all of them) back
+    # onto their Car objects so they can be drawn and sorted.
+    def sync(self, cars, indexes=None):
+        if indexes is None:
+            indexes = range(self._size)
+        for index in indexes:
+            car = cars[index]
+            car.set_state(
+                self.positions[index],
+                self.rotations[index],
+                self.speeds[index],
+                not self.alive[index],
+                int(self.scores[index])
+            )
+
+# The same as Car.get_nn_move, but for a (n, 6) matrix of NN
+# outputs at once. Returns arrays of accelerations and rotations.
+def get_nn_moves(orders):
+    orders = orders >= 0.5
+    acceleration = 0.5 * orders[:, 0] - 0.5 * orders[:, 1]
+    rotation = (1 * orders[:, 2] + 4 * orders[:, 3]) - (1 * orders[:, 4] + 4 * orders[:, 5])
+    return acceleration, rotation
@@ -0,0 +1,118 @@
+import cProfile
+import json
+import os
+from time import perf_counter
+
+# A PhaseTimer adds up the wall time spent in, and number of calls
+# to, each phase of the hot loop - sensing, inference, physics,
+# collisions and so on (see Simulation.step and Game.on_render) - over
+# a generation. Timing is entirely optional: the loops only call it
+# when a timer is set, so when it is off the only cost is a check for
+# None per phase.
+#
+# Usage inside a loop:
+#   started = perf_counter()
+#   ...sense...
+#   started = timer.time("sense", started)
+#   ...infer...
+#   started = timer.time("infer", started)
+class PhaseTimer():
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.seconds = {}
+        self.calls = {}
+        self.steps = 0
+        self.car_steps = 0
+
+    # Add the time since started to phase, returning the current time
+    # so that it can start the next phase
+    def time(self, phase : str, started : float) -> float:
+        now = perf_counter()
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + now - started
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        return now
+
+    # Count a simulation step that moved the given number of cars
+    def step(self, cars : int):
+        self.steps += 1
+        self.car_steps += cars
+
+    # Add in the timings of a worker process that ran its share of the
+    # same generation (see parallel.py). The workers ran side by side,
+    # so their phase times add up to more than the wall time, and the
+    # generation took as many steps as the longest of them.
+    def merge(self, other):
+        for phase in other.seconds:
+            self.seconds[phase] = self.seconds.get(phase, 0.0) + other.seconds[phase]
+            self.calls[phase] = self.calls.get(phase, 0) + other.calls[phase]
+        self.steps = max(self.steps, other.steps)
+        self.car_steps += other.car_steps
+
+    # Everything timed so far, as a single record for the generation
+    # that took seconds of wall time
+    def summary(self, generation : int, seconds : float) -> dict:
+        return {
+            "generation": generation,
+            "seconds": seconds,
+            "steps": self.steps,
+            "car_steps": self.car_steps,
+            "steps_per_second": self.steps / seconds if seconds > 0 else 0.0,
+            "cars_per_second": self.car_steps / seconds if seconds > 0 else 0.0,
+            "phases": {
+                phase: {"seconds": self.seconds[phase], "calls": self.calls[phase]}
+                for phase in self.seconds
+            },
+        }
+
+# Writes each generation's PhaseTimer summary to filepath, either
+# appended as a line of JSON ("jsonl"), or in the Prometheus text
+# format ("prometheus") for a node exporter's textfile collector to
+# pick up - this replaces the file each generation.
+class TimingExporter():
+
+    def __init__(self, filepath : str, format : str = "jsonl"):
+        if format not in ("jsonl", "prometheus"):
+            raise ValueError(f"Unknown timing format {format}")
+        self._filepath = filepath
+        self._format = format
+
+    def export(self, record : dict):
+        if self._format == "jsonl":
+            with open(self._filepath, "a") as writefile:
+                writefile.write(json.dumps(record) + "\n")
+            return
+
+        temporary = self._filepath + ".tmp"
+        with open(temporary, "w") as writefile:
+            writefile.write(to_prometheus(record))
+        os.replace(temporary, self._filepath)
+
+def to_prometheus(record : dict, prefix : str = "evolving_cars") -> str:
+    lines = []
+    def metric(name, kind, help, samples):
+        lines.append(f"# HELP {prefix}_{name} {help}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{prefix}_{name}{labels} {value}")
+
+    metric("generation", "gauge", "The generation these timings are for", [("", record["generation"])])
+    metric("generation_seconds", "gauge", "Wall time spent on the generation", [("", record["seconds"])])
+    metric("steps", "gauge", "Simulation steps in the generation", [("", record["steps"])])
+    metric("steps_per_second", "gauge", "Simulation steps per second of wall time", [("", record["steps_per_second"])])
+    metric("cars_per_second", "gauge", "Car steps per second of wall time", [("", record["cars_per_second"])])
+    phases = record["phases"]
+    metric("phase_seconds", "gauge", "Wall time spent in each phase of the loop", [(f'{{phase="{phase}"}}', phases[phase]["seconds"]) for phase in phases])
+    metric("phase_calls", "gauge", "Calls to each phase of the loop", [(f'{{phase="{phase}"}}', phases[phase]["calls"]) for phase in phases])
+    return "\n".join(lines) + "\n"
+
+# Run function under cProfile, saving the stats to filepath (for
+# pstats or snakeviz), and return whatever it returned
+def profile(function, filepath : str):
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function)
+    finally:
+        profiler.dump_stats(filepath)
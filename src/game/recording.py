@@ -0,0 +1,126 @@
+import json
+import os
+
+import numpy as np
+
+# Trajectories are stored as one fixed width record per car per tick,
+# so any tick of any generation can be found with a little arithmetic
+# and read (memory mapped) without touching the rest of the file.
+POSE = np.dtype([
+    ("x", "<f4"),
+    ("y", "<f4"),
+    ("rotation", "<f4"),
+    ("speed", "<f4"),
+    ("alive", "u1"),
+])
+
+# Roughly how much is buffered before it is written out
+CHUNK_BYTES = 4 * 1024 * 1024
+
+# A TrajectoryRecorder writes the pose of every car, every tick, of
+# each generation to filepath - generation after generation, each a
+# (ticks, cars) block of POSE records. Poses are buffered and written
+# in chunks as the generation runs. Alongside it goes an index,
+# <filepath>.json, that says where each generation starts and how
+# long it is, along with the cars' colors and final scores, and which
+# track it was all on. The index is rewritten as each generation
+# finishes, so a recording can be replayed while training goes on.
+class TrajectoryRecorder():
+
+    def __init__(self, filepath : str, trackfile : str):
+        self._filepath = filepath
+        self._index = {"trackfile": trackfile, "pose": POSE.descr, "generations": []}
+        self._file = open(filepath, "wb")
+        self._offset = 0
+
+        self._buffer = None
+        self._buffered = 0
+        self._generation = None
+
+    # timestep is how many ticks apart the recorded poses are
+    def start(self, generation : int, colors : [(int, int, int)], timestep : int = 1):
+        cars = len(colors)
+        chunk = max(1, CHUNK_BYTES // (POSE.itemsize * max(cars, 1)))
+        if self._buffer is None or self._buffer.shape != (chunk, cars):
+            self._buffer = np.zeros((chunk, cars), dtype=POSE)
+        self._buffered = 0
+        self._generation = {
+            "generation": generation,
+            "cars": cars,
+            "offset": self._offset,
+            "ticks": 0,
+            "timestep": timestep,
+            "colors": [[int(channel) for channel in color] for color in colors],
+        }
+
+    # Record the current pose of every car in the population
+    def record(self, population):
+        row = self._buffer[self._buffered]
+        row["x"] = population.positions[:, 0]
+        row["y"] = population.positions[:, 1]
+        row["rotation"] = population.rotations
+        row["speed"] = population.speeds
+        row["alive"] = population.alive
+        self._buffered += 1
+        self._generation["ticks"] += 1
+        if self._buffered == len(self._buffer):
+            self.flush()
+
+    def flush(self):
+        if self._buffered == 0:
+            return
+        data = self._buffer[:self._buffered].tobytes()
+        self._file.write(data)
+        self._offset += len(data)
+        self._buffered = 0
+
+    # Finish the generation, given each car's final score
+    def finish(self, scores):
+        self.flush()
+        self._file.flush()
+        self._generation["scores"] = [int(score) for score in scores]
+        self._index["generations"].append(self._generation)
+        self._generation = None
+
+        temporary = self._filepath + ".json.tmp"
+        with open(temporary, "w") as writefile:
+            json.dump(self._index, writefile)
+        os.replace(temporary, self._filepath + ".json")
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+# A recording made by a TrajectoryRecorder, for reading
+class Recording():
+
+    def __init__(self, filepath : str):
+        self._filepath = filepath
+        with open(filepath + ".json", "r") as readfile:
+            self._index = json.load(readfile)
+        self.trackfile = self._index["trackfile"]
+        self.generations = self._index["generations"]
+
+    def __len__(self):
+        return len(self.generations)
+
+    # The (ticks, cars) POSE records of the given generation, memory
+    # mapped - by its position in the recording, so -1 is the latest
+    def poses(self, index : int):
+        generation = self.generations[index]
+        if generation["ticks"] == 0 or generation["cars"] == 0:
+            return np.zeros((generation["ticks"], generation["cars"]), dtype=POSE)
+        return np.memmap(
+            self._filepath,
+            dtype=POSE,
+            mode="r",
+            offset=generation["offset"],
+            shape=(generation["ticks"], generation["cars"])
+        )
+
+    # Where the given generation number is in the recording
+    def find(self, generation : int) -> int:
+        for index, recorded in enumerate(self.generations):
+            if recorded["generation"] == generation:
+                return index
+        raise ValueError(f"Generation {generation} was not recorded")
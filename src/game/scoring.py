@@ -0,0 +1,7 @@
+# How cars are scored - kept apart from the Car sprite so that the
+# simulation can score cars without importing pygame.
+CRASH = -50
+CHECKPOINT = 150
+NO_CHECKPOINTS = -100
+# For cars retired for making no progress - see stalling.py
+STALL = -100
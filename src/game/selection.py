@@ -0,0 +1,80 @@
+import numpy as np
+
+# Parent selection. Each strategy draws count parent indexes, with
+# replacement, given the parents' scores and a numpy Generator. They
+# are all vectorized so picking the parents of 10k children is a
+# handful of numpy calls.
+
+# The chance of a parent being picked is based on its score. Scores
+# can be negative (or all zero), so they are offset such that the
+# lowest is weighted 1.
+def fitness_weights(scores):
+    scores = np.asarray(scores, dtype=np.float64)
+    return scores + abs(scores.min()) + 1
+
+def proportional(scores, count : int, rng : np.random.Generator):
+    weights = fitness_weights(scores)
+    return rng.choice(len(weights), size=count, p=weights / weights.sum())
+
+# The best of size parents picked at random, count times
+def tournament(scores, count : int, rng : np.random.Generator, size : int = 3):
+    scores = np.asarray(scores)
+    entrants = rng.integers(0, len(scores), size=(count, size))
+    winners = np.argmax(scores[entrants], axis=1)
+    return entrants[np.arange(count), winners]
+
+# Like proportional, but by each parent's rank - the worst weighted
+# 1, the next 2, and so on, with ties sharing their average rank - so
+# one runaway score can't take over
+def rank(scores, count : int, rng : np.random.Generator):
+    scores = np.asarray(scores)
+    order = np.argsort(scores, kind='stable')
+    ranks = np.empty(len(order), dtype=np.float64)
+    ranks[order] = np.arange(1, len(order) + 1)
+    _, tie = np.unique(scores, return_inverse=True)
+    ranks = (np.bincount(tie, weights=ranks) / np.bincount(tie))[tie]
+    return rng.choice(len(ranks), size=count, p=ranks / ranks.sum())
+
+# Stochastic universal sampling - like proportional, but with count
+# evenly spaced pointers from a single random start, so each parent is
+# picked within one of its expected number of times. Shuffled so the
+# picks can be paired up.
+def stochastic_universal(scores, count : int, rng : np.random.Generator):
+    weights = fitness_weights(scores)
+    cumulative = np.cumsum(weights)
+    spacing = cumulative[-1] / count
+    pointers = rng.uniform(0, spacing) + spacing * np.arange(count)
+    picks = np.minimum(np.searchsorted(cumulative, pointers, side='right'), len(weights) - 1)
+    return rng.permutation(picks)
+
+SELECTIONS = {
+    "proportional": proportional,
+    "tournament": tournament,
+    "rank": rank,
+    "sus": stochastic_universal,
+}
+
+# Pick the (a, b) parent indexes of count children. A parent never
+# mates with itself - outside of mutation it would result in no
+# difference, plus the car could go blind - so any b that matches its
+# a is drawn again.
+def select_pairs(scores, count : int, rng : np.random.Generator = None, method : str = "proportional"):
+    if len(scores) < 2:
+        raise ValueError("At least two parents are needed to mate")
+    if method not in SELECTIONS:
+        raise ValueError(f"Unknown selection method {method}")
+    if rng is None:
+        rng = np.random.default_rng()
+    select = SELECTIONS[method]
+
+    picks = select(scores, 2 * count, rng)
+    a, b = picks[:count], picks[count:]
+    selfmates = np.flatnonzero(a == b)
+    while len(selfmates) > 0:
+        b[selfmates] = select(scores, len(selfmates), rng)
+        selfmates = selfmates[a[selfmates] == b[selfmates]]
+    return a, b
+
+# How many times each of the parents mated
+def mate_counts(a, b, parents : int):
+    return np.bincount(np.concatenate((a, b)), minlength=parents)
@@ -0,0 +1,288 @@
+import json
+import os
+
+import numpy as np
+
+# The angles, relative to the car's heading, that each car measures
+# the distance to the nearest wall at.
+DISTANCE_ANGLES = [-60, -30, 0, 30, 60]
+
+# Ray marching starts with small chunks as most walls are close by,
+# and grows them for the rays that keep on going.
+FIRST_CHUNK = 16
+MAX_CHUNK = 256
+
+# Any pixel that is not fully transparent is a wall. The resulting
+# boolean array is indexed [x, y] just like the surface itself.
+def occupancy_from_alpha(alpha):
+    return np.ascontiguousarray(alpha != 0)
+
+# The RaySensor does the same job as Track.distance_to_wall, but
+# for every angle of every car at once. Instead of building the
+# full Bresenham line to the edge of the track and checking each
+# pixel with get_at, we step along all of the rays together a
+# chunk of pixels at a time, looking the pixels up in the track's
+# occupancy array and dropping each ray as soon as it hits a wall.
+#
+# The edge intercepts and the pixels visited are exactly those of
+# distance_to_wall and bresenham.define_line, so the results match.
+class RaySensor():
+
+    def __init__(self, occupancy, angles : [int] = DISTANCE_ANGLES, max_range : float = None):
+        self._occupancy = occupancy
+        self._angles = np.array(angles, dtype=np.float64)
+        self._max_range = max_range
+
+    def get_size(self):
+        return self._occupancy.shape
+
+    # Given (n, 2) positions and (n,) rotations, returns (n, angles, 2)
+    # integer endpoints and (n, angles) distances for each car.
+    def sense(self, positions, rotations):
+        count = len(positions)
+        shape = (count, len(self._angles))
+
+        start = np.asarray(positions).astype(np.int64)
+        start_x = np.repeat(start[:, 0], len(self._angles))
+        start_y = np.repeat(start[:, 1], len(self._angles))
+        angle = ((self._angles[None, :] + np.asarray(rotations, dtype=np.float64)[:, None] + 90) % 360).ravel()
+
+        end_x, end_y = self.edge_intercepts(start_x, start_y, angle)
+        hit_x, hit_y = self.march(start_x, start_y, end_x, end_y)
+
+        distances = np.sqrt((hit_x - start_x)**2 + (hit_y - start_y)**2)
+        endpoints = np.stack((hit_x, hit_y), axis=1)
+        return endpoints.reshape(shape + (2,)), distances.reshape(shape)
+
+    # Where each ray leaves the track - this is the math from
+    # Track.distance_to_wall (see doc/trig.jpg) for every ray at once.
+    # If a max range is set the rays are cut short to it.
+    def edge_intercepts(self, start_x, start_y, angle):
+        width, height = self._occupancy.shape
+        max_x = width - 1
+        max_y = height - 1
+
+        end_x = np.zeros(len(angle), dtype=np.int64)
+        end_y = np.zeros(len(angle), dtype=np.int64)
+
+        def tan_floor(degrees, length):
+            return np.floor(np.tan(np.radians(degrees)) * length).astype(np.int64)
+
+        with np.errstate(over='ignore', invalid='ignore'):
+            # Quadrant 1
+            quadrant = angle <= 90
+            x = start_x + tan_floor(angle, max_y - start_y)
+            y = np.full(len(angle), max_y)
+            past = x > max_x
+            x = np.where(past, max_x, x)
+            y = np.where(past, start_y + tan_floor(90 - angle, max_x - start_x), y)
+            end_x[quadrant] = x[quadrant]
+            end_y[quadrant] = y[quadrant]
+
+            # Quadrant 2
+            quadrant = (angle > 90) & (angle <= 180)
+            x = np.full(len(angle), max_x)
+            y = start_y - tan_floor(angle - 90, max_x - start_x)
+            past = y < 0
+            x = np.where(past, start_x + tan_floor(180 - angle, start_y), x)
+            y = np.where(past, 0, y)
+            end_x[quadrant] = x[quadrant]
+            end_y[quadrant] = y[quadrant]
+
+            # Quadrant 3
+            quadrant = (angle > 180) & (angle <= 270)
+            x = start_x - tan_floor(angle - 180, start_y)
+            y = np.zeros(len(angle), dtype=np.int64)
+            past = x < 0
+            x = np.where(past, 0, x)
+            y = np.where(past, start_y - tan_floor(270 - angle, start_x), y)
+            end_x[quadrant] = x[quadrant]
+            end_y[quadrant] = y[quadrant]
+
+            # Quadrant 4
+            quadrant = angle > 270
+            x = np.zeros(len(angle), dtype=np.int64)
+            y = start_y + tan_floor(angle - 270, start_x)
+            past = y > max_y
+            x = np.where(past, start_x - tan_floor(360 - angle, max_y - start_y), x)
+            y = np.where(past, max_y, y)
+            end_x[quadrant] = x[quadrant]
+            end_y[quadrant] = y[quadrant]
+
+        # Straight lines
+        end_x[angle == 90] = max_x
+        end_x[angle == 270] = 0
+        end_y[(angle == 90) | (angle == 270)] = start_y[(angle == 90) | (angle == 270)]
+        end_y[angle == 0] = max_y
+        end_y[angle == 180] = 0
+        end_x[(angle == 0) | (angle == 180)] = start_x[(angle == 0) | (angle == 180)]
+
+        if self._max_range is not None:
+            length = np.sqrt((end_x - start_x)**2 + (end_y - start_y)**2)
+            scale = np.minimum(1.0, self._max_range / np.maximum(length, 1))
+            end_x = start_x + np.trunc((end_x - start_x) * scale).astype(np.int64)
+            end_y = start_y + np.trunc((end_y - start_y) * scale).astype(np.int64)
+
+        return np.clip(end_x, 0, max_x), np.clip(end_y, 0, max_y)
+
+    # Walk every ray from its start towards its end and return the
+    # first wall pixel it reaches, or its end if there is none.
+    def march(self, start_x, start_y, end_x, end_y):
+        width, height = self._occupancy.shape
+
+        # bresenham.define_line steps along the major axis, always
+        # drawing from the end with the lower major coordinate.
+        # Working from that end, the minor coordinate j pixels along
+        # is offset by (2*j*minor + major - 1) // (2*major)
+        low = np.abs(end_y - start_y) < np.abs(end_x - start_x)
+        major_start = np.where(low, start_x, start_y)
+        major_end = np.where(low, end_x, end_y)
+        minor_start = np.where(low, start_y, start_x)
+        minor_end = np.where(low, end_y, end_x)
+
+        reverse = major_start > major_end
+        origin_major = np.where(reverse, major_end, major_start)
+        origin_minor = np.where(reverse, minor_end, minor_start)
+        minor_delta = np.where(reverse, minor_start - minor_end, minor_end - minor_start)
+        minor_sign = np.where(minor_delta < 0, -1, 1)
+        minor_delta = np.abs(minor_delta)
+        major_delta = np.abs(major_end - major_start)
+        major_step = np.where(reverse, -1, 1)
+        major_span = np.maximum(major_delta, 1)
+
+        # Rays that never hit a wall stop at their end point
+        hit_x = end_x.copy()
+        hit_y = end_y.copy()
+
+        pending = np.arange(len(start_x))
+        offset = 0
+        chunk = FIRST_CHUNK
+        while len(pending) > 0:
+            step = offset + np.arange(chunk)[None, :]
+            major = major_start[pending, None] + step * major_step[pending, None]
+            along = major - origin_major[pending, None]
+            minor = origin_minor[pending, None] + minor_sign[pending, None] * ((2 * along * minor_delta[pending, None] + major_span[pending, None] - 1) // (2 * major_span[pending, None]))
+            valid = step <= major_delta[pending, None]
+
+            x = np.where(low[pending, None], major, minor)
+            y = np.where(low[pending, None], minor, major)
+            np.clip(x, 0, width - 1, out=x)
+            np.clip(y, 0, height - 1, out=y)
+
+            hits = self._occupancy[x, y] & valid
+            hit = hits.any(axis=1)
+            first = hits.argmax(axis=1)[hit]
+            hit_x[pending[hit]] = x[hit, first]
+            hit_y[pending[hit]] = y[hit, first]
+
+            offset += chunk
+            chunk = min(chunk * 2, MAX_CHUNK)
+            pending = pending[~hit & (major_delta[pending] >= offset)]
+
+        return hit_x, hit_y
+
+# Each free (non wall) pixel of the track gets a row in a sensor
+# table - this maps an [x, y] pixel to that row, or -1 for walls.
+def free_pixel_index(occupancy):
+    index = np.full(occupancy.shape, -1, dtype=np.int32)
+    free = ~occupancy
+    index[free] = np.arange(np.count_nonzero(free), dtype=np.int32)
+    return index
+
+# Build a table of the distance to the wall from every free pixel
+# of the track at every heading, in bins of resolution degrees.
+# The track never changes, so this can be done once ahead of time
+# (see load_sensor_table). out, if given, is filled in place - ie
+# a memory mapped file - otherwise a new array is returned.
+def build_sensor_table(occupancy, resolution : float = 2, dtype : str = "uint16", out=None, batch : int = 32768):
+    bins = int(round(360 / resolution))
+    free = np.argwhere(~occupancy)
+    if out is None:
+        out = np.zeros((len(free), bins), dtype=dtype)
+
+    caster = RaySensor(occupancy)
+    rounding = np.rint if np.issubdtype(np.dtype(dtype), np.integer) else (lambda distance: distance)
+    for heading in range(bins):
+        print(f"Building sensor table - heading {heading + 1} of {bins}", end="\r")
+        for offset in range(0, len(free), batch):
+            start_x = free[offset:offset + batch, 0].astype(np.int64)
+            start_y = free[offset:offset + batch, 1].astype(np.int64)
+            angle = np.full(len(start_x), heading * 360 / bins)
+            end_x, end_y = caster.edge_intercepts(start_x, start_y, angle)
+            hit_x, hit_y = caster.march(start_x, start_y, end_x, end_y)
+            distances = np.sqrt((hit_x - start_x)**2 + (hit_y - start_y)**2)
+            out[offset:offset + batch, heading] = rounding(distances)
+    print()
+
+    return out
+
+# SensorTable is a drop in replacement for the RaySensor that looks
+# the distances up in a table from build_sensor_table instead of
+# marching the rays. The heading of each ray is rounded to the
+# table's resolution, and the endpoints are found from the distance.
+# index, if given, is the occupancy's free_pixel_index, ie one that
+# is shared between processes.
+class SensorTable():
+
+    def __init__(self, occupancy, table, angles : [int] = DISTANCE_ANGLES, max_range : float = None, index = None):
+        self._occupancy = occupancy
+        self._index = index if index is not None else free_pixel_index(occupancy)
+        self._table = table
+        self._bins = table.shape[1]
+        self._angles = np.array(angles, dtype=np.float64)
+        self._max_range = max_range
+
+    def get_size(self):
+        return self._occupancy.shape
+
+    def sense(self, positions, rotations):
+        start = np.asarray(positions).astype(np.int64)
+        width, height = self._occupancy.shape
+        start_x = np.clip(start[:, 0], 0, width - 1)
+        start_y = np.clip(start[:, 1], 0, height - 1)
+
+        angle = (self._angles[None, :] + np.asarray(rotations, dtype=np.float64)[:, None] + 90) % 360
+        heading = np.rint(angle * self._bins / 360).astype(np.int64) % self._bins
+
+        # Cars sitting on a wall pixel are 0 from the wall
+        row = self._index[start_x, start_y]
+        distances = self._table[np.maximum(row, 0)[:, None], heading].astype(np.float64)
+        distances[row < 0] = 0
+        if self._max_range is not None:
+            np.minimum(distances, self._max_range, out=distances)
+
+        radians = np.radians(heading * 360 / self._bins)
+        endpoints = np.empty(distances.shape + (2,), dtype=np.int64)
+        endpoints[:, :, 0] = start_x[:, None] + np.trunc(distances * np.sin(radians))
+        endpoints[:, :, 1] = start_y[:, None] + np.trunc(distances * np.cos(radians))
+        return endpoints, distances
+
+# Load the sensor table stored at base (.npy for the table, .json
+# for what it was built from), memory mapped. It is (re)built first
+# if it doesn't exist yet, or if content_hash - a hash of whatever
+# the occupancy came from - has changed since.
+def load_sensor_table(base : str, occupancy, content_hash : str, resolution : float = 2, dtype : str = "uint16", angles : [int] = DISTANCE_ANGLES, max_range : float = None, index = None) -> SensorTable:
+    tablepath = f"{base}.npy"
+    infopath = f"{base}.json"
+
+    info = None
+    if os.path.exists(tablepath) and os.path.exists(infopath):
+        with open(infopath, 'r') as readfile:
+            info = json.load(readfile)
+
+    if info is None or info["image_hash"] != content_hash:
+        print(f"Building the sensor table {tablepath} - this only has to happen once")
+        free = int(np.count_nonzero(~occupancy))
+        bins = int(round(360 / resolution))
+        # Build into a temporary file so a half finished table is
+        # never mistaken for a real one
+        table = np.lib.format.open_memmap(f"{tablepath}.tmp", mode='w+', dtype=dtype, shape=(free, bins))
+        build_sensor_table(occupancy, resolution=resolution, dtype=dtype, out=table)
+        table.flush()
+        del table
+        os.replace(f"{tablepath}.tmp", tablepath)
+        with open(infopath, 'w') as writefile:
+            json.dump({"image_hash": content_hash, "resolution": resolution, "dtype": dtype}, writefile)
+
+    table = np.load(tablepath, mmap_mode='r')
+    return SensorTable(occupancy, table, angles=angles, max_range=max_range, index=index)
@@ -0,0 +1,102 @@
+import atexit
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .bundle import TrackBundle, from_geometry, GRIDS
+from .sensing import free_pixel_index
+
+ALIGNMENT = 64
+
+# The tracks this process has attached to, by name. Attachments last
+# as long as the process, as Simulations keep using their arrays.
+_attached = {}
+
+# A SharedTrack puts a track's read-only arrays - the wall and
+# collision grids, the car footprint, and (for sensor tables) the
+# free pixel index - into a single block of shared memory, once, in
+# the parent process. Worker processes attach to it by name and run
+# their Simulations straight off numpy views of that memory, so no
+# matter how many workers there are only one copy exists.
+#
+# The parent owns the block and unlinks it when closed, or at the
+# latest when it exits. Workers only ever close their view of it.
+class SharedTrack():
+
+    def __init__(self, memory : shared_memory.SharedMemory, layout : dict, geometry : dict, filepath : str = None, owner : bool = False):
+        self._memory = memory
+        self._layout = layout
+        self._geometry = geometry
+        self._filepath = filepath
+        self._owner = owner
+        self._closed = False
+
+        self.arrays = {}
+        for name, (offset, shape, dtype) in layout.items():
+            array = np.ndarray(tuple(shape), dtype=dtype, buffer=memory.buf, offset=offset)
+            array.flags.writeable = False
+            self.arrays[name] = array
+
+    # What a worker needs to attach - small enough to send anywhere
+    def descriptor(self) -> dict:
+        return {
+            "name": self._memory.name,
+            "layout": self._layout,
+            "geometry": self._geometry,
+            "filepath": self._filepath,
+        }
+
+    # A TrackBundle reading straight from the shared memory. It keeps
+    # this SharedTrack alive for as long as it is around.
+    def bundle(self) -> TrackBundle:
+        bundle = from_geometry(self._geometry, self.arrays, filepath=self._filepath)
+        bundle._shared = self
+        return bundle
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.arrays = {}
+        try:
+            self._memory.close()
+        except BufferError:
+            # Something still holds a view - the mapping goes away
+            # with the process instead
+            pass
+        if self._owner:
+            try:
+                self._memory.unlink()
+            except FileNotFoundError:
+                pass
+
+# Copy the bundle's arrays into a new block of shared memory. With
+# free_index, the sensing.free_pixel_index used by sensor tables is
+# worked out once here rather than in every worker.
+def publish_track(bundle : TrackBundle, free_index : bool = False) -> SharedTrack:
+    arrays = {name: np.asarray(getattr(bundle, name)) for name in GRIDS}
+    if free_index:
+        arrays["free_index"] = bundle.free_index if bundle.free_index is not None else free_pixel_index(bundle.occupancy)
+
+    layout = {}
+    size = 0
+    for name, array in arrays.items():
+        size += -size % ALIGNMENT
+        layout[name] = (size, list(array.shape), array.dtype.str)
+        size += array.nbytes
+
+    memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for name, array in arrays.items():
+        offset, shape, dtype = layout[name]
+        np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf, offset=offset)[...] = array
+
+    shared = SharedTrack(memory, layout, bundle.geometry(), filepath=bundle._filepath, owner=True)
+    atexit.register(shared.close)
+    return shared
+
+def attach_track(descriptor : dict) -> SharedTrack:
+    name = descriptor["name"]
+    if name not in _attached:
+        memory = shared_memory.SharedMemory(name=name)
+        _attached[name] = SharedTrack(memory, descriptor["layout"], descriptor["geometry"], filepath=descriptor["filepath"])
+    return _attached[name]
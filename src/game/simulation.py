@@ -0,0 +1,162 @@
+import numpy as np
+from time import perf_counter
+
+from .gates import GateIndex
+from .nn import PopulationNN
+from .population import Population, get_nn_moves, MAX_SPEED
+
+TIME_LIMIT = 60 # in simulated seconds
+# Each step advances the simulation by a fixed 1/TICKS_PER_SECOND
+# seconds, no matter how quickly (or slowly) the host can run it.
+TICKS_PER_SECOND = 60
+TICK_LIMIT = TIME_LIMIT * TICKS_PER_SECOND
+# The furthest apart, in pixels, collisions are checked along a car's
+# path - as far as a car can go in one tick, so one tick steps are
+# only ever checked where they end
+SWEEP_SPACING = MAX_SPEED
+
+# A Simulation runs one generation of cars, given as a matrix of
+# genomes (see nn.to_genomes), from the spawn point until they have
+# all crashed or time has run out. It needs nothing but the track's
+# sensor, collider, and checkpoint and finish line segments (each a
+# ((x, y), (x, y)) pair) - no display, no Car sprites, not even
+# pygame - so it can run anywhere, including worker processes.
+#
+# Each step covers timestep ticks: the cars sense and decide once,
+# then their moves are simulated in substeps equal parts. Every move
+# is swept - checked for walls along the whole path, stopping at the
+# first contact, and for crossed gates along what's left of it - so
+# cars can't tunnel through walls or checkpoints however long the
+# steps are. With substeps equal to timestep the physics is the same
+# as a tick at a time, with only the (costly) sensing and thinking
+# done less often.
+#
+# If stall_rules (see stalling.py) are given, cars that stop making
+# progress are retired early. If timer (a profiling.PhaseTimer) is
+# set, every phase of each step is timed.
+class Simulation():
+
+    def __init__(
+        self,
+        sensor,
+        collider,
+        checkpoints,
+        finishline,
+        position : (int, int),
+        rotation : float,
+        tick_limit : int = TICK_LIMIT,
+        stall_rules = None,
+        timestep : int = 1,
+        substeps : int = 1
+        ):
+        self._sensor = sensor
+        self._collider = collider
+        self._checkpoints = checkpoints
+        self._finishline = finishline
+        self._position = position
+        self._rotation = rotation
+        self._tick_limit = tick_limit
+        self._stall_rules = stall_rules
+        self._timestep = timestep
+        self._substeps = substeps
+
+        self.population = None
+        self.tick = 0
+        self.timer = None
+        self._nn = None
+        self._gates = GateIndex(checkpoints, finishline)
+
+    def get_time_since_start(self):
+        return self.tick / TICKS_PER_SECOND
+
+    def start(self, genomes):
+        size = len(genomes)
+        self.population = Population([self._position] * size, [self._rotation] * size, checkpoints=len(self._checkpoints))
+        self._nn = PopulationNN(genomes)
+        if self._stall_rules is not None:
+            self._stall_rules.start(self.population)
+        self.tick = 0
+
+    def running(self):
+        return self.tick < self._tick_limit and self.population.cars_alive() > 0
+
+    def step(self):
+        population = self.population
+        seconds = self.get_time_since_start()
+        timer = self.timer
+        if timer is not None:
+            timer.step(population.cars_alive())
+            started = perf_counter()
+
+        active = population.active
+        endpoints, distances = self._sensor.sense(population.positions[active], population.rotations[active])
+        population.endpoints[active] = endpoints
+        population.distances[active] = distances
+        if timer is not None:
+            started = timer.time("sense", started)
+
+        # Run every car's NN in one batch
+        orders = self._nn.infer(population.nn_inputs(), active)
+        accelerations, rotations = get_nn_moves(orders)
+        if timer is not None:
+            started = timer.time("infer", started)
+
+        # Step the physics for every car in one go, substeps times,
+        # holding each car to the move it decided on. The last step is
+        # cut short rather than run past the tick limit.
+        timestep = min(self._timestep, max(self._tick_limit - self.tick, 1))
+        dt = timestep / self._substeps
+        for substep in range(self._substeps):
+            if substep > 0:
+                moving = population.alive[active]
+                active = active[moving]
+                accelerations = accelerations[moving]
+                rotations = rotations[moving]
+                if len(active) == 0:
+                    break
+                seconds = (self.tick + substep * dt) / TICKS_PER_SECOND
+            previous = population.positions[active]
+            population.move(accelerations, rotations, dt)
+            current = population.positions[active]
+            if timer is not None:
+                started = timer.time("move", started)
+
+            samples = np.maximum(np.ceil(population.speeds[active] * dt / SWEEP_SPACING), 1).astype(np.int64)
+            crashed, contacts = self._collider.sweep(previous, current, population.rotations[active], samples)
+            # Crashed cars stop where they first touched the wall
+            current[crashed] = contacts[crashed]
+            population.positions[active[crashed]] = contacts[crashed]
+            population.crash(active[crashed], seconds)
+            if timer is not None:
+                started = timer.time("collide", started)
+
+            # In the order they were crossed - the finish line clears
+            # the checkpoints crossed before it
+            crossed, checkpoints, after, finished = self._gates.crossings(active, previous, current)
+            scored = population.cross_checkpoint(crossed[~after], checkpoints[~after], seconds)
+            population.cross_finish_line(finished)
+            scored_after = population.cross_checkpoint(crossed[after], checkpoints[after], seconds)
+            if self._stall_rules is not None:
+                self._stall_rules.progress(scored, self.tick + timestep)
+                self._stall_rules.progress(finished, self.tick + timestep)
+                self._stall_rules.progress(scored_after, self.tick + timestep)
+            if timer is not None:
+                started = timer.time("checkpoints", started)
+
+        self.tick += timestep
+
+        if self._stall_rules is not None:
+            population.stall(self._stall_rules.stalled(population, self.tick))
+            if timer is not None:
+                timer.time("stall", started)
+
+    # Score the cars once the run is over, returning their scores
+    def finish(self):
+        self.population.add_end_score()
+        return self.population.scores
+
+    def run(self, genomes):
+        self.start(genomes)
+        while self.running():
+            self.step()
+        return self.finish()
@@ -0,0 +1,133 @@
+import json
+import os
+import struct
+import threading
+
+import numpy as np
+
+from .nn import GENOME_SIZE
+
+# A snapshot is everything needed to pick an evolution run back up
+# where it left off: the genomes of a scored generation (best first)
+# and their scores, the generation number, the mutation rate and
+# parent cutoff, and the state of every random number generator.
+#
+# It is stored as a single binary file:
+#   MAGIC, then the length of the header as a little endian uint64
+#   a JSON header, padded with spaces to a multiple of ALIGNMENT
+#   a (cars, GENOME_SIZE) float32 genome matrix
+#   a (cars,) int64 score array
+# so the genomes and scores can be memory-mapped on load instead of
+# parsed. Networks run on float64 weights, so the genomes of a resumed
+# run are the saved ones rounded to float32 - close to, but not
+# exactly, those of a run that was never stopped.
+MAGIC = b"EVOCARS1"
+ALIGNMENT = 64
+
+class Snapshot():
+
+    def __init__(
+        self,
+        genomes,
+        scores,
+        generation : int,
+        mutation_rate : float,
+        parent_cutoff : int,
+        rng_state : dict = None
+        ):
+        self.genomes = genomes
+        self.scores = scores
+        self.generation = generation
+        self.mutation_rate = mutation_rate
+        self.parent_cutoff = parent_cutoff
+        self.rng_state = rng_state
+
+    def __len__(self):
+        return len(self.genomes)
+
+def save_snapshot(filepath : str, snapshot : Snapshot):
+    genomes = np.ascontiguousarray(snapshot.genomes, dtype=np.float32).reshape(-1, GENOME_SIZE)
+    scores = np.ascontiguousarray(snapshot.scores, dtype=np.int64)
+
+    header = json.dumps({
+        "cars": len(genomes),
+        "genome_size": GENOME_SIZE,
+        "generation": snapshot.generation,
+        "mutation_rate": snapshot.mutation_rate,
+        "parent_cutoff": snapshot.parent_cutoff,
+        "rng_state": snapshot.rng_state,
+    }).encode()
+    start = len(MAGIC) + 8
+    header += b" " * (-(start + len(header)) % ALIGNMENT)
+
+    # Written in full next to the old snapshot and then swapped in,
+    # so a run killed mid write still leaves a good snapshot behind
+    temporary = filepath + ".tmp"
+    with open(temporary, "wb") as writefile:
+        writefile.write(MAGIC + struct.pack("<Q", len(header)) + header)
+        writefile.write(genomes.data)
+        writefile.write(scores.data)
+        writefile.flush()
+        os.fsync(writefile.fileno())
+    os.replace(temporary, filepath)
+
+def load_snapshot(filepath : str) -> Snapshot:
+    with open(filepath, "rb") as readfile:
+        if readfile.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{filepath} is not a snapshot")
+        (length,) = struct.unpack("<Q", readfile.read(8))
+        header = json.loads(readfile.read(length))
+
+    if header["genome_size"] != GENOME_SIZE:
+        raise ValueError(f"{filepath} has genomes of size {header['genome_size']}, expected {GENOME_SIZE}")
+
+    cars = header["cars"]
+    offset = len(MAGIC) + 8 + length
+    genomes = np.memmap(filepath, dtype=np.float32, mode="r", offset=offset, shape=(cars, GENOME_SIZE))
+    offset += genomes.nbytes
+    scores = np.memmap(filepath, dtype=np.int64, mode="r", offset=offset, shape=(cars,))
+
+    return Snapshot(
+        genomes,
+        scores,
+        header["generation"],
+        header["mutation_rate"],
+        header["parent_cutoff"],
+        header["rng_state"]
+    )
+
+# Saves snapshots on a background thread so training never waits on
+# the disk. Only the newest snapshot matters, so if one is still being
+# written when the next arrives, the next simply waits its turn. If a
+# save fails, the error is raised by the next call to write, wait or
+# close - training doesn't carry on as if it had been saved.
+class SnapshotWriter():
+
+    def __init__(self, filepath : str):
+        self._filepath = filepath
+        self._thread = None
+        self._error = None
+
+    # The snapshot's arrays must not be changed afterwards - pass
+    # copies (to_genomes and astype both make one).
+    def write(self, snapshot : Snapshot):
+        self.wait()
+        self._thread = threading.Thread(target=self._save, args=(snapshot,))
+        self._thread.start()
+
+    def _save(self, snapshot : Snapshot):
+        try:
+            save_snapshot(self._filepath, snapshot)
+        except Exception as error:
+            self._error = error
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def close(self):
+        self.wait()
@@ -0,0 +1,51 @@
+import numpy as np
+
+# StallRules retire cars that have stopped making progress - ones
+# that have rolled to a stop, or are spinning in place - so that a
+# generation can end as soon as nothing useful is happening instead
+# of running out the clock. Either rule can be left off (None):
+#
+#   checkpoint_ticks - a car is stalled if it hasn't crossed a new
+#       checkpoint (or the finish line) in this many ticks
+#   window, min_distance - every window ticks (or the first step
+#       after, if steps are more than a tick), a car is stalled if
+#       it has ended up less than min_distance pixels from where it
+#       was at the start of the window
+#
+# Stalled cars are scored with STALL (see Population.stall).
+class StallRules():
+
+    def __init__(self, checkpoint_ticks : int = None, window : int = None, min_distance : float = 20):
+        self._checkpoint_ticks = checkpoint_ticks
+        self._window = window
+        self._min_distance = min_distance
+
+        self._last_progress = None
+        self._anchors = None
+        self._window_start = 0
+
+    def start(self, population):
+        self._last_progress = np.zeros(len(population), dtype=np.int64)
+        self._anchors = population.positions.copy()
+        self._window_start = 0
+
+    # Note the cars at the given indexes as having made progress
+    def progress(self, indexes, tick : int):
+        self._last_progress[indexes] = tick
+
+    # The indexes of the active cars that have stalled as of tick
+    def stalled(self, population, tick : int):
+        active = population.active
+        stalled = np.zeros(len(active), dtype=bool)
+
+        if self._checkpoint_ticks is not None:
+            stalled |= tick - self._last_progress[active] >= self._checkpoint_ticks
+
+        if self._window is not None and tick - self._window_start >= self._window:
+            positions = population.positions[active]
+            moved = np.hypot(*(positions - self._anchors[active]).T)
+            stalled |= moved < self._min_distance
+            self._anchors[active] = positions
+            self._window_start = tick
+
+        return active[stalled]
@@ -1,21 +1,44 @@
 import pygame
+import numpy as np
+import hashlib
+import os
 from .car import Car
 from math import radians, floor, tan, sqrt
 from .bresenham import define_line
+from .sensing import occupancy_from_alpha, load_sensor_table, SensorTable, DISTANCE_ANGLES
 
 class Track(pygame.sprite.Sprite):
 
     def __init__(self, filename : str):
         super().__init__()
 
+        self._filename = filename
         self.surf = pygame.image.load(filename)
         self.rect = self.surf.get_rect()
         self.rect.topleft= [0,0]
         self.mask = pygame.mask.from_surface(self.surf)
+        # Boolean [x, y] arrays of wall pixels - any opacity at all
+        # blocks the sensors, while collisions use the same threshold
+        # as the mask above.
+        alpha = pygame.surfarray.array_alpha(self.surf)
+        self.occupancy = occupancy_from_alpha(alpha)
+        self.solid = np.ascontiguousarray(alpha > 127)
 
     def get_size(self):
         return self.surf.get_size()
 
+    def image_hash(self):
+        with open(self._filename, 'rb') as readfile:
+            return hashlib.sha256(readfile.read()).hexdigest()
+
+    # Load the precomputed sensor table for this track, memory mapped,
+    # from next to the given track file. It is (re)built first if it
+    # doesn't exist yet, or if the track image has changed since.
+    # See sensing.build_sensor_table.
+    def sensor_table(self, trackpath : str, resolution : float = 2, dtype : str = "uint16", angles : [int] = DISTANCE_ANGLES, max_range : float = None) -> SensorTable:
+        base = f"{os.path.splitext(trackpath)[0]}.sensors-{resolution:g}deg-{dtype}"
+        return load_sensor_table(base, self.occupancy, self.image_hash(), resolution=resolution, dtype=dtype, angles=angles, max_range=max_range)
+
     # Given a car and an angle, find the distance from
     # the car's center to the wall at that angle.
     # Much like the checkpoint's collision detection
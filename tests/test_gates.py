@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from src.game.car import Car
+from src.game.checkpoint import Checkpoint
+from src.game.game import load_from_file
+from src.game.gates import GateIndex, segments_intersect, crossing_fraction
+from src.game.nn import NN, to_genomes
+
+TRACK = os.path.join(os.path.dirname(__file__), "..", "tracks", "track2.json")
+
+def test_one_move_crosses_several_gates():
+    gates = GateIndex([((10, -20), (10, 20)), ((20, -20), (20, 20))], ((500, 0), (500, 10)))
+    cars, checkpoints, after, finished = gates.crossings(np.array([0]), np.array([[0.0, 0.0]]), np.array([[30.0, 0.0]]))
+    assert sorted(zip(cars, checkpoints)) == [(0, 0), (0, 1)]
+    assert not after.any()
+    assert len(finished) == 0
+
+def test_checkpoints_after_the_finish_line():
+    gates = GateIndex([((10, -20), (10, 20)), ((30, -20), (30, 20))], ((20, -20), (20, 20)))
+    cars, checkpoints, after, finished = gates.crossings(np.array([4]), np.array([[0.0, 0.0]]), np.array([[40.0, 0.0]]))
+    assert list(finished) == [4]
+    assert dict(zip(checkpoints, after)) == {0: False, 1: True}
+
+# Scores a Simulation's moves the way the cars always have been: each
+# car checked against every gate, one at a time, and scored by
+# Car.cross_checkpoint, Car.cross_finish_line and Car.add_end_score
+class ReferenceScorer():
+
+    def __init__(self, simulation, size : int):
+        self._checkpoints = [Checkpoint(start, end) for start, end in simulation._checkpoints]
+        self._finishline = simulation._finishline
+        self.cars = [Car((0, 0)) for _ in range(size)]
+
+    def move(self, indexes, previous, current, seconds):
+        for row, index in enumerate(indexes):
+            car = self.cars[index]
+            gates = [(checkpoint, checkpoint._start_at, checkpoint._end_at) for checkpoint in self._checkpoints]
+            gates.append((None, self._finishline[0], self._finishline[1]))
+            crossed = []
+            for checkpoint, start, end in gates:
+                segment = (previous[row:row + 1], current[row:row + 1], np.array([start], dtype=np.float64), np.array([end], dtype=np.float64))
+                if segments_intersect(*segment)[0]:
+                    crossed.append((crossing_fraction(*segment)[0], checkpoint is None, checkpoint))
+            for _, finish, checkpoint in sorted(crossed, key=lambda crossing : (crossing[0], crossing[1])):
+                if finish:
+                    car.cross_finish_line()
+                else:
+                    car.cross_checkpoint(checkpoint, seconds)
+
+def test_scores_match_per_car_scoring():
+    game = load_from_file(TRACK, headless=True, seed=1)
+    game.init()
+    np.random.seed(1)
+    genomes = to_genomes([NN() for _ in range(30)])
+    game._tick_limit = 600
+    simulation = game.create_simulation()
+    simulation.start(genomes)
+    population = simulation.population
+    reference = ReferenceScorer(simulation, len(genomes))
+
+    # Follow every move and crash of the Simulation
+    crossings = simulation._gates.crossings
+    def crossings_spy(indexes, previous, current):
+        reference.move(indexes, previous, current, simulation.get_time_since_start())
+        return crossings(indexes, previous, current)
+    simulation._gates.crossings = crossings_spy
+    crash = population.crash
+    def crash_spy(indexes, seconds):
+        for index in indexes:
+            reference.cars[index].crash(seconds)
+        crash(indexes, seconds)
+    population.crash = crash_spy
+
+    while simulation.running():
+        simulation.step()
+    scores = simulation.finish()
+    for car in reference.cars:
+        car.add_end_score(simulation.get_time_since_start())
+
+    assert [car._score for car in reference.cars] == list(scores)
+    # Cars spawn next to a checkpoint in the middle of the list on
+    # this track, so some must have scored out of order
+    assert (scores > 0).any()